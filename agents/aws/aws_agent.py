@@ -1,9 +1,44 @@
-from typing import Dict, List, Any, Optional
+from typing import Any, Optional, Iterator
 from datetime import datetime, timedelta
+import logging
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import boto3
-import json
+import orjson
+from botocore.config import Config
 import os
-from ..base_agent import BaseLogAgent
+import threading
+from ..base_agent import BaseLogAgent, LogRecord, SEVERITY_LEVELS, dig, dumps_raw
+
+logger = logging.getLogger(__name__)
+
+# Maximum page sizes documented for each API
+CLOUDTRAIL_PAGE_SIZE = 50
+GUARDDUTY_PAGE_SIZE = 50
+GUARDDUTY_GET_FINDINGS_MAX = 50
+SECURITYHUB_PAGE_SIZE = 100
+
+# Lower bounds of the medium, high and critical severity levels
+GUARDDUTY_SEVERITY_THRESHOLDS = (2, 4, 7)
+SECURITYHUB_SEVERITY_THRESHOLDS = (20, 40, 70)
+
+# Pool sized for the concurrent fan-out in fetch_logs; adaptive retries
+# back off client-side when the services start throttling
+CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+    connect_timeout=5,
+    read_timeout=30
+)
+
+# Maximum in-flight requests per service across all regions and threads;
+# GuardDuty has the tightest API quotas
+SERVICE_CONCURRENCY = {
+    'cloudtrail': 10,
+    'guardduty': 3,
+    'securityhub': 5
+}
 
 class AWSAgent(BaseLogAgent):
     def __init__(self, config_path: str):
@@ -14,7 +49,21 @@ class AWSAgent(BaseLogAgent):
             'aws_access_key_id': os.getenv('AWS_ACCESS_KEY', self.config.get('credentials', {}).get('access_key', '')),
             'aws_secret_access_key': os.getenv('AWS_SECRET_KEY', self.config.get('credentials', {}).get('secret_key', ''))
         }
+        # A single session is reused for every client so credentials are
+        # resolved once and clients share connection pools across runs
+        self.session = boto3.session.Session(**self.credentials)
         self.clients = {}
+        # Detector IDs never change for a region, so keep them across runs
+        self._detector_ids = {}
+        self._limits = {
+            service: threading.Semaphore(limit)
+            for service, limit in SERVICE_CONCURRENCY.items()
+        }
+        self._dispatch = {
+            'cloudtrail': self._fetch_cloudtrail_logs,
+            'guardduty': self._fetch_guardduty_findings,
+            'securityhub': self._fetch_securityhub_findings
+        }
 
     def connect(self) -> bool:
         """Establish connections to AWS services"""
@@ -24,26 +73,26 @@ class AWSAgent(BaseLogAgent):
                 for service in self.services:
                     service_name = service.lower()
                     if service == 'CloudTrail':
-                        self.clients[region][service_name] = boto3.client(
+                        self.clients[region][service_name] = self.session.client(
                             'cloudtrail',
                             region_name=region,
-                            **self.credentials
+                            config=CLIENT_CONFIG
                         )
                     elif service == 'GuardDuty':
-                        self.clients[region][service_name] = boto3.client(
+                        self.clients[region][service_name] = self.session.client(
                             'guardduty',
                             region_name=region,
-                            **self.credentials
+                            config=CLIENT_CONFIG
                         )
                     elif service == 'SecurityHub':
-                        self.clients[region][service_name] = boto3.client(
+                        self.clients[region][service_name] = self.session.client(
                             'securityhub',
                             region_name=region,
-                            **self.credentials
+                            config=CLIENT_CONFIG
                         )
             return True
         except Exception as e:
-            print(f"Failed to connect to AWS services: {e}")
+            logger.error("Failed to connect to AWS services: %s", e)
             return False
 
     def disconnect(self) -> None:
@@ -51,61 +100,61 @@ class AWSAgent(BaseLogAgent):
         self.clients.clear()
 
     def fetch_logs(self, start_time: Optional[datetime] = None,
-                  end_time: Optional[datetime] = None) -> List[Dict[str, Any]]:
+                  end_time: Optional[datetime] = None) -> Iterator[LogRecord]:
         """Fetch logs from AWS services"""
         if not start_time:
             start_time = datetime.now() - timedelta(hours=1)
         if not end_time:
             end_time = datetime.now()
 
-        all_logs = []
-        for region, services in self.clients.items():
-            for service_name, client in services.items():
-                try:
-                    if service_name == 'cloudtrail':
-                        logs = self._fetch_cloudtrail_logs(client, start_time, end_time)
-                    elif service_name == 'guardduty':
-                        logs = self._fetch_guardduty_findings(client, start_time, end_time)
-                    elif service_name == 'securityhub':
-                        logs = self._fetch_securityhub_findings(client, start_time, end_time)
-                    all_logs.extend(logs)
-                except Exception as e:
-                    print(f"Error fetching {service_name} logs from {region}: {e}")
-
-        return all_logs
-
-    def _fetch_cloudtrail_logs(self, client, start_time: datetime, end_time: datetime) -> List[Dict[str, Any]]:
+        # boto3 clients are thread-safe once created, so each (region, service)
+        # pair can be fetched concurrently
+        tasks = [
+            (f"{service_name} logs from {region}",
+             partial(self._dispatch[service_name], client, start_time, end_time))
+            for region, services in self.clients.items()
+            for service_name, client in services.items()
+            if service_name in self._dispatch
+        ]
+        return self._fetch_concurrently(tasks)
+
+    def _fetch_cloudtrail_logs(self, client, start_time: datetime, end_time: datetime) -> Iterator[LogRecord]:
         """Fetch CloudTrail logs"""
-        logs = []
         try:
-            response = client.lookup_events(
+            paginator = client.get_paginator('lookup_events')
+            pages = paginator.paginate(
                 StartTime=start_time,
                 EndTime=end_time,
-                MaxResults=self.batch_size
+                PaginationConfig={'PageSize': CLOUDTRAIL_PAGE_SIZE}
             )
-            for event in response.get('Events', []):
-                logs.append({
-                    'service': 'cloudtrail',
-                    'raw': json.dumps(event),
-                    'timestamp': event.get('EventTime', '').isoformat(),
-                    'source': 'aws',
-                    'event_type': event.get('EventName', 'unknown'),
-                    'user': event.get('Username', 'unknown'),
-                    'source_ip': event.get('SourceIPAddress', ''),
-                    'action': event.get('EventName', ''),
-                    'status': event.get('ResponseElements', {}).get('status', ''),
-                    'message': event.get('CloudTrailEvent', '')
-                })
+            for event in self._search_pages('cloudtrail', pages, 'Events'):
+                # CloudTrailEvent is already the JSON record from the service:
+                # pass it through as-is and decode it once for the fields that
+                # only exist inside it
+                raw = event.get('CloudTrailEvent', '{}')
+                detail = orjson.loads(raw)
+                yield LogRecord(
+                    service='cloudtrail',
+                    raw=raw,
+                    timestamp=event['EventTime'].isoformat(),
+                    source='aws',
+                    event_type=event.get('EventName', 'unknown'),
+                    user=event.get('Username', 'unknown'),
+                    source_ip=detail.get('sourceIPAddress', ''),
+                    action=event.get('EventName', ''),
+                    status=dig(detail, 'responseElements', 'status'),
+                    message=raw
+                )
         except Exception as e:
-            print(f"Error fetching CloudTrail logs: {e}")
-        return logs
+            logger.exception("Error fetching CloudTrail logs: %s", e)
 
-    def _fetch_guardduty_findings(self, client, start_time: datetime, end_time: datetime) -> List[Dict[str, Any]]:
+    def _fetch_guardduty_findings(self, client, start_time: datetime, end_time: datetime) -> Iterator[LogRecord]:
         """Fetch GuardDuty findings"""
-        logs = []
         try:
-            response = client.list_findings(
-                DetectorId=self._get_detector_id(client),
+            detector_id = self._get_detector_id(client)
+            paginator = client.get_paginator('list_findings')
+            pages = paginator.paginate(
+                DetectorId=detector_id,
                 FindingCriteria={
                     'Criterion': {
                         'updatedAt': {
@@ -114,86 +163,102 @@ class AWSAgent(BaseLogAgent):
                         }
                     }
                 },
-                MaxResults=self.batch_size
+                PaginationConfig={'PageSize': GUARDDUTY_PAGE_SIZE}
             )
-            findings = client.get_findings(
-                DetectorId=self._get_detector_id(client),
-                FindingIds=response.get('FindingIds', [])
-            )
-            for finding in findings.get('Findings', []):
-                logs.append({
-                    'service': 'guardduty',
-                    'raw': json.dumps(finding),
-                    'timestamp': finding.get('UpdatedAt', '').isoformat(),
-                    'source': 'aws',
-                    'event_type': finding.get('Type', 'unknown'),
-                    'severity': self._map_guardduty_severity(finding.get('Severity', 0)),
-                    'source_ip': finding.get('Service', {}).get('Action', {}).get('NetworkConnectionAction', {}).get('RemoteIpDetails', {}).get('IpAddressV4', ''),
-                    'action': finding.get('Service', {}).get('Action', {}).get('ActionType', ''),
-                    'status': finding.get('Service', {}).get('Action', {}).get('NetworkConnectionAction', {}).get('ConnectionDirection', ''),
-                    'message': finding.get('Description', '')
-                })
+            finding_ids = list(self._search_pages('guardduty', pages, 'FindingIds'))
+
+            # get_findings accepts at most 50 IDs per call; fetch the chunks
+            # concurrently
+            chunks = [
+                finding_ids[i:i + GUARDDUTY_GET_FINDINGS_MAX]
+                for i in range(0, len(finding_ids), GUARDDUTY_GET_FINDINGS_MAX)
+            ]
+            if not chunks:
+                return
+
+            def get_findings(ids):
+                with self._limits['guardduty']:
+                    return client.get_findings(DetectorId=detector_id, FindingIds=ids)
+
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+                responses = executor.map(get_findings, chunks)
+                for response in responses:
+                    for finding in response.get('Findings', []):
+                        yield LogRecord(
+                            service='guardduty',
+                            raw=dumps_raw(finding),
+                            timestamp=finding.get('UpdatedAt', '').isoformat(),
+                            source='aws',
+                            event_type=finding.get('Type', 'unknown'),
+                            severity=self._map_guardduty_severity(finding.get('Severity', 0)),
+                            source_ip=dig(finding, 'Service', 'Action', 'NetworkConnectionAction', 'RemoteIpDetails', 'IpAddressV4'),
+                            action=dig(finding, 'Service', 'Action', 'ActionType'),
+                            status=dig(finding, 'Service', 'Action', 'NetworkConnectionAction', 'ConnectionDirection'),
+                            message=finding.get('Description', '')
+                        )
         except Exception as e:
-            print(f"Error fetching GuardDuty findings: {e}")
-        return logs
+            logger.exception("Error fetching GuardDuty findings: %s", e)
 
-    def _fetch_securityhub_findings(self, client, start_time: datetime, end_time: datetime) -> List[Dict[str, Any]]:
+    def _fetch_securityhub_findings(self, client, start_time: datetime, end_time: datetime) -> Iterator[LogRecord]:
         """Fetch SecurityHub findings"""
-        logs = []
         try:
-            response = client.get_findings(
+            paginator = client.get_paginator('get_findings')
+            pages = paginator.paginate(
                 Filters={
                     'UpdatedAt': [{
                         'Gte': start_time.isoformat(),
                         'Lte': end_time.isoformat()
                     }]
                 },
-                MaxResults=self.batch_size
+                PaginationConfig={'PageSize': SECURITYHUB_PAGE_SIZE}
             )
-            for finding in response.get('Findings', []):
-                logs.append({
-                    'service': 'securityhub',
-                    'raw': json.dumps(finding),
-                    'timestamp': finding.get('UpdatedAt', '').isoformat(),
-                    'source': 'aws',
-                    'event_type': finding.get('Type', 'unknown'),
-                    'severity': self._map_securityhub_severity(finding.get('Severity', {}).get('Normalized', 0)),
-                    'source_ip': finding.get('Resources', [{}])[0].get('Details', {}).get('AwsEc2Instance', {}).get('PublicIpAddress', ''),
-                    'action': finding.get('Remediation', {}).get('Recommendation', {}).get('Text', ''),
-                    'status': finding.get('RecordState', ''),
-                    'message': finding.get('Description', '')
-                })
+            for finding in self._search_pages('securityhub', pages, 'Findings'):
+                yield LogRecord(
+                    service='securityhub',
+                    raw=dumps_raw(finding),
+                    timestamp=finding.get('UpdatedAt', '').isoformat(),
+                    source='aws',
+                    event_type=finding.get('Type', 'unknown'),
+                    severity=self._map_securityhub_severity(dig(finding, 'Severity', 'Normalized', default=0)),
+                    source_ip=dig(finding, 'Resources', 0, 'Details', 'AwsEc2Instance', 'PublicIpAddress'),
+                    action=dig(finding, 'Remediation', 'Recommendation', 'Text'),
+                    status=finding.get('RecordState', ''),
+                    message=finding.get('Description', '')
+                )
         except Exception as e:
-            print(f"Error fetching SecurityHub findings: {e}")
-        return logs
+            logger.exception("Error fetching SecurityHub findings: %s", e)
+
+    def _search_pages(self, service: str, pages, key: str) -> Iterator[Any]:
+        """Yield the items under key from each page
+
+        The service's semaphore is held only while a page is being
+        requested, not while its items are consumed.
+        """
+        pages = iter(pages)
+        while True:
+            with self._limits[service]:
+                page = next(pages, None)
+            if page is None:
+                return
+            yield from page.get(key, [])
 
     def _get_detector_id(self, client) -> str:
-        """Get the GuardDuty detector ID"""
-        response = client.list_detectors()
-        return response.get('DetectorIds', [''])[0]
+        """Get the GuardDuty detector ID for the client's region"""
+        region = client.meta.region_name
+        if region not in self._detector_ids:
+            with self._limits['guardduty']:
+                response = client.list_detectors()
+            self._detector_ids[region] = response.get('DetectorIds', [''])[0]
+        return self._detector_ids[region]
 
     def _map_guardduty_severity(self, severity: float) -> str:
         """Map GuardDuty severity to standard severity levels"""
-        if severity >= 7:
-            return 'critical'
-        elif severity >= 4:
-            return 'high'
-        elif severity >= 2:
-            return 'medium'
-        else:
-            return 'low'
+        return SEVERITY_LEVELS[bisect_right(GUARDDUTY_SEVERITY_THRESHOLDS, severity)]
 
     def _map_securityhub_severity(self, severity: int) -> str:
         """Map SecurityHub severity to standard severity levels"""
-        if severity >= 70:
-            return 'critical'
-        elif severity >= 40:
-            return 'high'
-        elif severity >= 20:
-            return 'medium'
-        else:
-            return 'low'
-
-    def parse_log(self, log: Dict[str, Any]) -> Dict[str, Any]:
+        return SEVERITY_LEVELS[bisect_right(SECURITYHUB_SEVERITY_THRESHOLDS, severity)]
+
+    def parse_log(self, log: LogRecord) -> LogRecord:
         """Parse and normalize an AWS log entry"""
         return log  # Already normalized in fetch methods 
\ No newline at end of file
@@ -1,13 +1,36 @@
-from typing import Dict, List, Any, Optional
+from typing import Optional, Iterator
 from datetime import datetime, timedelta
+import logging
+from functools import partial
 from azure.identity import DefaultAzureCredential
 from azure.mgmt.security import SecurityCenter
 from azure.monitor import MonitorClient
-import json
 import os
-from ..base_agent import BaseLogAgent
+from ..base_agent import BaseLogAgent, LogRecord, dumps_raw
+
+logger = logging.getLogger(__name__)
+
+SECURITY_CENTER_SEVERITY_MAP = {
+    'Critical': 'critical',
+    'High': 'high',
+    'Medium': 'medium',
+    'Low': 'low'
+}
+
+MONITOR_LEVEL_MAP = {
+    'Critical': 'critical',
+    'Error': 'high',
+    'Warning': 'medium',
+    'Informational': 'low'
+}
+
+MONITOR_FILTER_TEMPLATE = "eventTimestamp ge '{start}' and eventTimestamp le '{end}'"
 
 class AzureAgent(BaseLogAgent):
+    # Shared by all instances: the credential caches its access tokens until
+    # they expire, so the credential chain only runs once per process
+    _credential = None
+
     def __init__(self, config_path: str):
         super().__init__(config_path)
         self.subscription_id = os.getenv('AZURE_SUBSCRIPTION_ID', 
@@ -20,8 +43,10 @@ class AzureAgent(BaseLogAgent):
     def connect(self) -> bool:
         """Establish connections to Azure services"""
         try:
-            credential = DefaultAzureCredential()
-            
+            if type(self)._credential is None:
+                type(self)._credential = DefaultAzureCredential()
+            credential = type(self)._credential
+
             if 'SecurityCenter' in self.services:
                 self.clients['security_center'] = SecurityCenter(
                     credential=credential,
@@ -36,132 +61,117 @@ class AzureAgent(BaseLogAgent):
             
             return True
         except Exception as e:
-            print(f"Failed to connect to Azure services: {e}")
+            logger.error("Failed to connect to Azure services: %s", e)
             return False
 
     def disconnect(self) -> None:
         """Close Azure service connections"""
-        self.clients.clear()
+        while self.clients:
+            _, client = self.clients.popitem()
+            client.close()
 
     def fetch_logs(self, start_time: Optional[datetime] = None,
-                  end_time: Optional[datetime] = None) -> List[Dict[str, Any]]:
+                  end_time: Optional[datetime] = None) -> Iterator[LogRecord]:
         """Fetch logs from Azure services"""
-        if not start_time:
-            start_time = datetime.now() - timedelta(hours=1)
+        # Services without a previous window read the last hour
+        default_start = datetime.now() - timedelta(hours=1)
         if not end_time:
             end_time = datetime.now()
 
-        all_logs = []
-        
-        if 'security_center' in self.clients:
-            try:
-                security_logs = self._fetch_security_center_logs(start_time, end_time)
-                all_logs.extend(security_logs)
-            except Exception as e:
-                print(f"Error fetching Security Center logs: {e}")
-
-        if 'monitor' in self.clients:
-            try:
-                monitor_logs = self._fetch_monitor_logs(start_time, end_time)
-                all_logs.extend(monitor_logs)
-            except Exception as e:
-                print(f"Error fetching Monitor logs: {e}")
-
-        return all_logs
+        fetchers = {
+            'security_center': ('Security Center', self._fetch_security_center_logs),
+            'monitor': ('Monitor', self._fetch_monitor_logs)
+        }
+        tasks = []
+        for name, (label, fetch) in fetchers.items():
+            if name in self.clients:
+                service_start = self._window_start(name, start_time, default_start)
+                tasks.append((f"{label} logs", partial(fetch, service_start, end_time)))
+        return self._fetch_concurrently(tasks)
 
     def _fetch_security_center_logs(self, start_time: datetime, 
-                                  end_time: datetime) -> List[Dict[str, Any]]:
+                                  end_time: datetime) -> Iterator[LogRecord]:
         """Fetch logs from Azure Security Center"""
-        logs = []
         try:
             # Get security alerts
             alerts = self.clients['security_center'].alerts.list()
             for alert in alerts:
                 if start_time <= alert.reported_time <= end_time:
-                    logs.append({
-                        'service': 'security_center',
-                        'raw': json.dumps(alert.as_dict()),
-                        'timestamp': alert.reported_time.isoformat(),
-                        'source': 'azure',
-                        'event_type': alert.alert_type,
-                        'severity': self._map_security_center_severity(alert.severity),
-                        'source_ip': alert.extended_properties.get('source_ip', ''),
-                        'action': alert.recommended_action,
-                        'status': alert.state,
-                        'message': alert.description
-                    })
+                    yield LogRecord(
+                        service='security_center',
+                        raw=dumps_raw(alert.as_dict()),
+                        timestamp=alert.reported_time.isoformat(),
+                        source='azure',
+                        event_type=alert.alert_type,
+                        severity=self._map_security_center_severity(alert.severity),
+                        source_ip=alert.extended_properties.get('source_ip', ''),
+                        action=alert.recommended_action,
+                        status=alert.state,
+                        message=alert.description
+                    )
 
             # Get security recommendations
             recommendations = self.clients['security_center'].assessments.list()
             for rec in recommendations:
                 if start_time <= rec.assessment_date <= end_time:
-                    logs.append({
-                        'service': 'security_center',
-                        'raw': json.dumps(rec.as_dict()),
-                        'timestamp': rec.assessment_date.isoformat(),
-                        'source': 'azure',
-                        'event_type': 'recommendation',
-                        'severity': self._map_security_center_severity(rec.severity),
-                        'source_ip': '',
-                        'action': rec.remediation,
-                        'status': rec.status.code,
-                        'message': rec.display_name
-                    })
+                    yield LogRecord(
+                        service='security_center',
+                        raw=dumps_raw(rec.as_dict()),
+                        timestamp=rec.assessment_date.isoformat(),
+                        source='azure',
+                        event_type='recommendation',
+                        severity=self._map_security_center_severity(rec.severity),
+                        source_ip='',
+                        action=rec.remediation,
+                        status=rec.status.code,
+                        message=rec.display_name
+                    )
         except Exception as e:
-            print(f"Error processing Security Center logs: {e}")
-        return logs
+            logger.exception("Error processing Security Center logs: %s", e)
 
     def _fetch_monitor_logs(self, start_time: datetime, 
-                          end_time: datetime) -> List[Dict[str, Any]]:
+                          end_time: datetime) -> Iterator[LogRecord]:
         """Fetch logs from Azure Monitor"""
-        logs = []
         try:
+            seen = self._seen_ids['monitor']
+            seen.prune(start_time)
+
             # Get activity logs
-            filter_query = (
-                f"eventTimestamp ge '{start_time.isoformat()}' and "
-                f"eventTimestamp le '{end_time.isoformat()}'"
+            filter_query = MONITOR_FILTER_TEMPLATE.format(
+                start=start_time.isoformat(),
+                end=end_time.isoformat()
             )
             activity_logs = self.clients['monitor'].activity_logs.list(
                 filter=filter_query
             )
             
             for log in activity_logs:
-                logs.append({
-                    'service': 'monitor',
-                    'raw': json.dumps(log.as_dict()),
-                    'timestamp': log.event_timestamp.isoformat(),
-                    'source': 'azure',
-                    'event_type': log.operation_name.value,
-                    'severity': self._map_monitor_severity(log.level),
-                    'source_ip': log.caller,
-                    'action': log.operation_name.value,
-                    'status': log.status.value,
-                    'message': log.description
-                })
+                if not seen.add(log.event_data_id, end_time):
+                    continue
+                yield LogRecord(
+                    service='monitor',
+                    raw=dumps_raw(log.as_dict()),
+                    timestamp=log.event_timestamp.isoformat(),
+                    source='azure',
+                    event_type=log.operation_name.value,
+                    severity=self._map_monitor_severity(log.level),
+                    source_ip=log.caller,
+                    action=log.operation_name.value,
+                    status=log.status.value,
+                    message=log.description
+                )
+            self._last_end_time['monitor'] = end_time
         except Exception as e:
-            print(f"Error processing Monitor logs: {e}")
-        return logs
+            logger.exception("Error processing Monitor logs: %s", e)
 
     def _map_security_center_severity(self, severity: str) -> str:
         """Map Security Center severity to standard severity levels"""
-        severity_map = {
-            'Critical': 'critical',
-            'High': 'high',
-            'Medium': 'medium',
-            'Low': 'low'
-        }
-        return severity_map.get(severity, 'low')
+        return SECURITY_CENTER_SEVERITY_MAP.get(severity, 'low')
 
     def _map_monitor_severity(self, level: str) -> str:
         """Map Monitor log level to standard severity levels"""
-        level_map = {
-            'Critical': 'critical',
-            'Error': 'high',
-            'Warning': 'medium',
-            'Informational': 'low'
-        }
-        return level_map.get(level, 'low')
+        return MONITOR_LEVEL_MAP.get(level, 'low')
 
-    def parse_log(self, log: Dict[str, Any]) -> Dict[str, Any]:
+    def parse_log(self, log: LogRecord) -> LogRecord:
         """Parse and normalize an Azure log entry"""
         return log  # Already normalized in fetch methods 
\ No newline at end of file
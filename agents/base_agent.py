@@ -1,14 +1,183 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, Iterable, Iterator, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import queue
+import threading
+import time
 import yaml
+import orjson
 import os
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Standard severity levels in ascending order, for threshold lookups
+SEVERITY_LEVELS = ('low', 'medium', 'high', 'critical')
+
+# Seconds by which incremental fetch windows overlap, unless configured
+INGESTION_LAG = 300
+
+def dig(record: Any, *keys: Any, default: Any = '') -> Any:
+    """Look up a nested value by a path of keys/indexes, or return default"""
+    for key in keys:
+        try:
+            record = record[key]
+        except (KeyError, IndexError, TypeError):
+            return default
+    return default if record is None else record
+
+# Marks the end of a producer's items on a buffer queue
+_DONE = object()
+
+def _put(buffer: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """Put an item on a bounded queue, giving up once stop is set"""
+    while not stop.is_set():
+        try:
+            buffer.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def prefetch(iterable: Iterable[Any], maxsize: int) -> Iterator[Any]:
+    """Iterate in a background thread, buffering up to maxsize items ahead
+
+    Lets a paginated client request the next page while the current one
+    is still being processed. Errors from the iterable are re-raised in
+    the consumer.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(buffer, item, stop):
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put(buffer, _DONE, stop)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                break
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        # Unblock the producer if the consumer stops early
+        stop.set()
+
+# (epoch second, ISO string of that second) for now_iso
+_now_cache = (None, None)
+
+def now_iso() -> str:
+    """Return the current local time in ISO format
+
+    The date and time are only formatted once per second; the microseconds
+    are appended to the cached string. Like datetime.isoformat(), the
+    fraction is left out when the microseconds are zero.
+    """
+    global _now_cache
+    second, fraction = divmod(time.time_ns(), 1_000_000_000)
+    cached_second, prefix = _now_cache
+    if second != cached_second:
+        prefix = datetime.fromtimestamp(second).isoformat()
+        _now_cache = (second, prefix)
+    microsecond = fraction // 1000
+    return f"{prefix}.{microsecond:06d}" if microsecond else prefix
+
+def dumps_raw(record: Any) -> str:
+    """Serialize a raw source record to JSON, including datetime values"""
+    return orjson.dumps(record, option=orjson.OPT_NAIVE_UTC).decode()
+
+class SeenIds:
+    """IDs of entries already fetched, remembered while an overlapping
+    later fetch window could return them again"""
+    def __init__(self):
+        # entry ID -> end of the window it was first fetched in
+        self._window_ends = {}
+
+    def prune(self, start: datetime) -> None:
+        """Forget entries that a window starting at start cannot return"""
+        self._window_ends = {
+            entry_id: end for entry_id, end in self._window_ends.items() if end >= start
+        }
+
+    def add(self, entry_id: Any, window_end: datetime) -> bool:
+        """Record an entry; returns False if it was already fetched"""
+        if entry_id in self._window_ends:
+            return False
+        self._window_ends[entry_id] = window_end
+        return True
+
+class LogRecord:
+    """Normalized log entry
+
+    Slots keep per-record memory well below a dict's; convert to a dict
+    with as_dict() only at serialization boundaries.
+    """
+    __slots__ = ('service', 'raw', 'timestamp', 'source', 'event_type', 'severity',
+                 'user', 'source_ip', 'destination_ip', 'host', 'sourcetype', 'agent',
+                 'rule', 'action', 'status', 'message')
+
+    def __init__(self, service: Optional[str] = None, raw: Optional[str] = None,
+                 timestamp: Optional[str] = None, source: Optional[str] = None,
+                 event_type: Optional[str] = None, severity: Optional[str] = None,
+                 user: Optional[str] = None, source_ip: Optional[str] = None,
+                 destination_ip: Optional[str] = None, host: Optional[str] = None,
+                 sourcetype: Optional[str] = None, agent: Optional[str] = None,
+                 rule: Any = None, action: Any = None, status: Any = None,
+                 message: Any = None):
+        self.service = service
+        self.raw = raw
+        self.timestamp = timestamp
+        self.source = source
+        self.event_type = event_type
+        self.severity = severity
+        self.user = user
+        self.source_ip = source_ip
+        self.destination_ip = destination_ip
+        self.host = host
+        self.sourcetype = sourcetype
+        self.agent = agent
+        self.rule = rule
+        self.action = action
+        self.status = status
+        self.message = message
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the populated fields as a dict"""
+        record = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                record[name] = value
+        return record
 
 class BaseLogAgent(ABC):
     def __init__(self, config_path: str):
         self.config = self._load_config(config_path)
         self.last_run = None
+        self._connected = False
+        # (connected, time) of the last probe()
+        self._last_probe = (None, None)
         self.batch_size = self.config.get('batch_size', 1000)
+        self.max_workers = self.config.get('max_workers', 20)
+        # End of the last fully consumed window per incremental service
+        self._last_end_time = {}
+        # Entries can be ingested after a window was read, so each window
+        # overlaps the previous one by the ingestion lag; entries already
+        # fetched in the overlap are skipped
+        self.ingestion_lag = timedelta(seconds=self.config.get('ingestion_lag', INGESTION_LAG))
+        self._seen_ids = defaultdict(SeenIds)
 
     @abstractmethod
     def connect(self) -> bool:
@@ -22,12 +191,12 @@ class BaseLogAgent(ABC):
 
     @abstractmethod
     def fetch_logs(self, start_time: Optional[datetime] = None, 
-                  end_time: Optional[datetime] = None) -> List[Dict[str, Any]]:
+                  end_time: Optional[datetime] = None) -> Iterable[Any]:
         """Fetch logs from the source"""
         pass
 
     @abstractmethod
-    def parse_log(self, log: Dict[str, Any]) -> Dict[str, Any]:
+    def parse_log(self, log: Any) -> LogRecord:
         """Parse and normalize a single log entry"""
         pass
 
@@ -36,41 +205,127 @@ class BaseLogAgent(ABC):
         with open(config_path, 'r') as f:
             return yaml.safe_load(f)
 
-    def process_logs(self, logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Process a batch of logs"""
-        processed_logs = []
+    def _fetch_concurrently(self, tasks: List[Tuple[str, Callable[[], Iterable[Dict[str, Any]]]]]
+                            ) -> Iterator[Dict[str, Any]]:
+        """Run fetchers on a thread pool and yield their logs as they arrive
+
+        Each task is a (label, fetch) pair where fetch() returns an iterable
+        of logs. At most batch_size logs are buffered between the fetcher
+        threads and the consumer.
+        """
+        if not tasks:
+            return
+
+        buffer = queue.Queue(maxsize=self.batch_size)
+        stop = threading.Event()
+
+        def drain(label: str, fetch: Callable[[], Iterable[Dict[str, Any]]]):
+            try:
+                for log in fetch():
+                    if not _put(buffer, log, stop):
+                        return
+            except Exception as e:
+                logger.exception("Error fetching %s: %s", label, e)
+            finally:
+                _put(buffer, _DONE, stop)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tasks))) as executor:
+            for label, fetch in tasks:
+                executor.submit(drain, label, fetch)
+
+            remaining = len(tasks)
+            try:
+                while remaining:
+                    item = buffer.get()
+                    if item is _DONE:
+                        remaining -= 1
+                    else:
+                        yield item
+            finally:
+                # Unblock fetchers if the consumer stops early
+                stop.set()
+
+    def _window_start(self, service: str, start_time: Optional[datetime],
+                      default: datetime) -> datetime:
+        """Start of a service's next fetch window
+
+        An explicit start_time is used as given. Without one, incremental
+        services resume from the end of their previous window instead of
+        re-reading from default.
+        """
+        if start_time is not None:
+            return start_time
+        last_end = self._last_end_time.get(service)
+        return default if last_end is None else last_end - self.ingestion_lag
+
+    def process_logs(self, logs: Iterable[Any]) -> Iterator[LogRecord]:
+        """Process a stream of logs"""
         for log in logs:
             try:
-                processed_log = self.parse_log(log)
-                processed_logs.append(processed_log)
+                yield self.parse_log(log)
             except Exception as e:
-                print(f"Error processing log: {e}")
+                logger.exception("Error processing log: %s", e)
                 continue
-        return processed_logs
 
-    def run(self) -> List[Dict[str, Any]]:
-        """Main execution method"""
+    def run(self) -> Iterator[LogRecord]:
+        """Main execution method
+
+        Yields processed logs as they are fetched. The connection is kept
+        open between runs; callers are expected to call disconnect() once
+        they are done with the agent.
+        """
         try:
-            if not self.connect():
-                raise ConnectionError("Failed to connect to log source")
+            if not self._connected:
+                if not self.connect():
+                    raise ConnectionError("Failed to connect to log source")
+                self._connected = True
 
-            logs = self.fetch_logs()
-            processed_logs = self.process_logs(logs)
+            yield from self.process_logs(self.fetch_logs())
             self.last_run = datetime.now()
 
-            return processed_logs
-
         except Exception as e:
-            print(f"Error in agent execution: {e}")
-            return []
+            logger.exception("Error in agent execution: %s", e)
+            # Release the clients and force a fresh connection on the next run
+            self._disconnect_quietly()
+            self._connected = False
 
-        finally:
+    def _disconnect_quietly(self) -> None:
+        """Disconnect, logging rather than raising errors"""
+        try:
             self.disconnect()
+        except Exception as e:
+            logger.error("Error disconnecting from log source: %s", e)
+
+    def probe(self) -> bool:
+        """Check that the log source accepts connections
+
+        Agents that are not running in this process, such as those the
+        API reports on, connect briefly and disconnect again. The result
+        is reported by get_status().
+        """
+        connected = self._connected
+        if not connected:
+            try:
+                connected = self.connect()
+            except Exception as e:
+                logger.error("Failed to probe log source: %s", e)
+                connected = False
+            finally:
+                self._disconnect_quietly()
+        self._last_probe = (connected, datetime.now())
+        return connected
 
     def get_status(self) -> Dict[str, Any]:
-        """Get agent status"""
+        """Get agent status
+
+        last_run is the time of the last successful fetch. The source is
+        not contacted: agents that are not connected report the result of
+        the last probe(), or None if they were never probed.
+        """
+        probed, last_probe = self._last_probe
         return {
             'last_run': self.last_run,
-            'connected': self.connect(),
+            'connected': True if self._connected else probed,
+            'last_probe': last_probe,
             'config': self.config
-        } 
\ No newline at end of file
+        }
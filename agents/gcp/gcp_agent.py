@@ -1,11 +1,39 @@
-from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
+from typing import Optional, Iterator
+from datetime import datetime, timedelta, timezone
+import logging
+from bisect import bisect_right
+from functools import partial
 from google.cloud import securitycenter_v1
 from google.cloud import monitoring_v3
 from google.cloud import logging_v2
-import json
+from google.protobuf.timestamp_pb2 import Timestamp
 import os
-from ..base_agent import BaseLogAgent
+from ..base_agent import BaseLogAgent, LogRecord, prefetch, SEVERITY_LEVELS, dumps_raw
+
+logger = logging.getLogger(__name__)
+
+SECURITY_CENTER_SEVERITY_MAP = {
+    'CRITICAL': 'critical',
+    'HIGH': 'high',
+    'MEDIUM': 'medium',
+    'LOW': 'low'
+}
+
+LOGGING_SEVERITY_MAP = {
+    'CRITICAL': 'critical',
+    'ERROR': 'high',
+    'WARNING': 'medium',
+    'INFO': 'low'
+}
+
+# Lower bounds of the medium, high and critical severity levels
+MONITORING_SEVERITY_THRESHOLDS = (0.4, 0.6, 0.8)
+
+# Windows are half-open, so an entry on the boundary between two windows is
+# only read once
+SECURITY_CENTER_FILTER_TEMPLATE = 'state = "ACTIVE" AND eventTime >= "{start}" AND eventTime < "{end}"'
+LOGGING_FILTER_TEMPLATE = 'timestamp >= "{start}" AND timestamp < "{end}" AND severity >= WARNING'
+MONITORING_FILTER = 'metric.type = "monitoring.googleapis.com/alerting/violations"'
 
 class GCPAgent(BaseLogAgent):
     def __init__(self, config_path: str):
@@ -29,122 +57,115 @@ class GCPAgent(BaseLogAgent):
             
             return True
         except Exception as e:
-            print(f"Failed to connect to GCP services: {e}")
+            logger.error("Failed to connect to GCP services: %s", e)
             return False
 
     def disconnect(self) -> None:
         """Close GCP service connections"""
-        self.clients.clear()
+        while self.clients:
+            _, client = self.clients.popitem()
+            client.transport.close()
 
     def fetch_logs(self, start_time: Optional[datetime] = None,
-                  end_time: Optional[datetime] = None) -> List[Dict[str, Any]]:
+                  end_time: Optional[datetime] = None) -> Iterator[LogRecord]:
         """Fetch logs from GCP services"""
-        if not start_time:
-            start_time = datetime.now() - timedelta(hours=1)
+        # Windows are in UTC: Timestamp.FromDatetime treats naive datetimes
+        # as UTC, and the filters carry an explicit offset
+        now = datetime.now(timezone.utc)
+        # Services without a previous window read the last hour
+        default_start = now - timedelta(hours=1)
         if not end_time:
-            end_time = datetime.now()
-
-        all_logs = []
-        
-        if 'security_center' in self.clients:
-            try:
-                security_logs = self._fetch_security_center_logs(start_time, end_time)
-                all_logs.extend(security_logs)
-            except Exception as e:
-                print(f"Error fetching Security Command Center logs: {e}")
-
-        if 'monitoring' in self.clients:
-            try:
-                monitoring_logs = self._fetch_monitoring_logs(start_time, end_time)
-                all_logs.extend(monitoring_logs)
-            except Exception as e:
-                print(f"Error fetching Cloud Monitoring logs: {e}")
-
-        if 'logging' in self.clients:
-            try:
-                cloud_logs = self._fetch_cloud_logging_logs(start_time, end_time)
-                all_logs.extend(cloud_logs)
-            except Exception as e:
-                print(f"Error fetching Cloud Logging logs: {e}")
-
-        return all_logs
+            end_time = now
+
+        fetchers = {
+            'security_center': ('Security Command Center', self._fetch_security_center_logs),
+            'monitoring': ('Cloud Monitoring', self._fetch_monitoring_logs),
+            'logging': ('Cloud Logging', self._fetch_cloud_logging_logs)
+        }
+        tasks = []
+        for name, (label, fetch) in fetchers.items():
+            if name in self.clients:
+                service_start = self._window_start(name, start_time, default_start)
+                tasks.append((f"{label} logs", partial(fetch, service_start, end_time)))
+        return self._fetch_concurrently(tasks)
 
     def _fetch_security_center_logs(self, start_time: datetime, 
-                                  end_time: datetime) -> List[Dict[str, Any]]:
+                                  end_time: datetime) -> Iterator[LogRecord]:
         """Fetch logs from Security Command Center"""
-        logs = []
         try:
             # Get findings
             request = securitycenter_v1.ListFindingsRequest(
                 parent=f"organizations/{self.config.get('organization_id')}/sources/-",
-                filter=f"state = \"ACTIVE\" AND eventTime >= \"{start_time.isoformat()}\" AND eventTime <= \"{end_time.isoformat()}\""
+                filter=SECURITY_CENTER_FILTER_TEMPLATE.format(
+                    start=start_time.isoformat(),
+                    end=end_time.isoformat()
+                )
             )
             
-            for finding in self.clients['security_center'].list_findings(request=request):
-                logs.append({
-                    'service': 'security_command_center',
-                    'raw': json.dumps(finding.to_dict()),
-                    'timestamp': finding.event_time.isoformat(),
-                    'source': 'gcp',
-                    'event_type': finding.category,
-                    'severity': self._map_security_center_severity(finding.severity),
-                    'source_ip': finding.source_properties.get('source_ip', ''),
-                    'action': finding.state,
-                    'status': finding.state,
-                    'message': finding.description
-                })
+            findings = self.clients['security_center'].list_findings(request=request)
+            for finding in prefetch(findings, self.batch_size):
+                yield LogRecord(
+                    service='security_command_center',
+                    raw=dumps_raw(finding.to_dict()),
+                    timestamp=finding.event_time.isoformat(),
+                    source='gcp',
+                    event_type=finding.category,
+                    severity=self._map_security_center_severity(finding.severity),
+                    source_ip=finding.source_properties.get('source_ip', ''),
+                    action=finding.state,
+                    status=finding.state,
+                    message=finding.description
+                )
         except Exception as e:
-            print(f"Error processing Security Command Center logs: {e}")
-        return logs
+            logger.exception("Error processing Security Command Center logs: %s", e)
 
     def _fetch_monitoring_logs(self, start_time: datetime, 
-                             end_time: datetime) -> List[Dict[str, Any]]:
+                             end_time: datetime) -> Iterator[LogRecord]:
         """Fetch logs from Cloud Monitoring"""
-        logs = []
         try:
-            project_name = self.clients['monitoring'].project_path(self.project_id)
-            
             # Get alerting policy violations
-            interval = monitoring_v3.TimeInterval({
-                'start_time': start_time.isoformat(),
-                'end_time': end_time.isoformat()
-            })
+            start = Timestamp()
+            start.FromDatetime(start_time)
+            end = Timestamp()
+            end.FromDatetime(end_time)
+            interval = monitoring_v3.TimeInterval(start_time=start, end_time=end)
             
             request = monitoring_v3.ListTimeSeriesRequest(
-                name=project_name,
-                filter='metric.type = "monitoring.googleapis.com/alerting/violations"',
+                name=f"projects/{self.project_id}",
+                filter=MONITORING_FILTER,
                 interval=interval
             )
             
-            for time_series in self.clients['monitoring'].list_time_series(request=request):
+            series = self.clients['monitoring'].list_time_series(request=request)
+            for time_series in prefetch(series, self.batch_size):
                 for point in time_series.points:
-                    logs.append({
-                        'service': 'cloud_monitoring',
-                        'raw': json.dumps(time_series.to_dict()),
-                        'timestamp': point.interval.start_time.isoformat(),
-                        'source': 'gcp',
-                        'event_type': time_series.metric.type,
-                        'severity': self._map_monitoring_severity(point.value.double_value),
-                        'source_ip': '',
-                        'action': 'alert',
-                        'status': 'active',
-                        'message': f"Alert: {time_series.metric.type} - {point.value.double_value}"
-                    })
+                    yield LogRecord(
+                        service='cloud_monitoring',
+                        raw=dumps_raw(time_series.to_dict()),
+                        timestamp=point.interval.start_time.isoformat(),
+                        source='gcp',
+                        event_type=time_series.metric.type,
+                        severity=self._map_monitoring_severity(point.value.double_value),
+                        source_ip='',
+                        action='alert',
+                        status='active',
+                        message=f"Alert: {time_series.metric.type} - {point.value.double_value}"
+                    )
         except Exception as e:
-            print(f"Error processing Cloud Monitoring logs: {e}")
-        return logs
+            logger.exception("Error processing Cloud Monitoring logs: %s", e)
 
     def _fetch_cloud_logging_logs(self, start_time: datetime, 
-                                end_time: datetime) -> List[Dict[str, Any]]:
+                                end_time: datetime) -> Iterator[LogRecord]:
         """Fetch logs from Cloud Logging"""
-        logs = []
         try:
+            seen = self._seen_ids['logging']
+            seen.prune(start_time)
+
             resource_names = [f"projects/{self.project_id}"]
             
-            filter_query = (
-                f"timestamp >= \"{start_time.isoformat()}\" AND "
-                f"timestamp <= \"{end_time.isoformat()}\" AND "
-                "severity >= WARNING"
+            filter_query = LOGGING_FILTER_TEMPLATE.format(
+                start=start_time.isoformat(),
+                end=end_time.isoformat()
             )
             
             request = logging_v2.ListLogEntriesRequest(
@@ -153,53 +174,38 @@ class GCPAgent(BaseLogAgent):
                 order_by="timestamp desc"
             )
             
-            for entry in self.clients['logging'].list_log_entries(request=request):
-                logs.append({
-                    'service': 'cloud_logging',
-                    'raw': json.dumps(entry.to_dict()),
-                    'timestamp': entry.timestamp.isoformat(),
-                    'source': 'gcp',
-                    'event_type': entry.severity.name,
-                    'severity': self._map_logging_severity(entry.severity),
-                    'source_ip': entry.resource.labels.get('source_ip', ''),
-                    'action': entry.resource.type,
-                    'status': entry.severity.name,
-                    'message': entry.text_payload or entry.json_payload
-                })
+            entries = self.clients['logging'].list_log_entries(request=request)
+            for entry in prefetch(entries, self.batch_size):
+                if not seen.add(entry.insert_id, end_time):
+                    continue
+                yield LogRecord(
+                    service='cloud_logging',
+                    raw=dumps_raw(entry.to_dict()),
+                    timestamp=entry.timestamp.isoformat(),
+                    source='gcp',
+                    event_type=entry.severity.name,
+                    severity=self._map_logging_severity(entry.severity),
+                    source_ip=entry.resource.labels.get('source_ip', ''),
+                    action=entry.resource.type,
+                    status=entry.severity.name,
+                    message=entry.text_payload or entry.json_payload
+                )
+            self._last_end_time['logging'] = end_time
         except Exception as e:
-            print(f"Error processing Cloud Logging logs: {e}")
-        return logs
+            logger.exception("Error processing Cloud Logging logs: %s", e)
 
     def _map_security_center_severity(self, severity: str) -> str:
         """Map Security Command Center severity to standard severity levels"""
-        severity_map = {
-            'CRITICAL': 'critical',
-            'HIGH': 'high',
-            'MEDIUM': 'medium',
-            'LOW': 'low'
-        }
-        return severity_map.get(severity, 'low')
+        return SECURITY_CENTER_SEVERITY_MAP.get(severity, 'low')
 
     def _map_monitoring_severity(self, value: float) -> str:
         """Map Monitoring metric value to standard severity levels"""
-        if value >= 0.8:
-            return 'critical'
-        elif value >= 0.6:
-            return 'high'
-        elif value >= 0.4:
-            return 'medium'
-        return 'low'
+        return SEVERITY_LEVELS[bisect_right(MONITORING_SEVERITY_THRESHOLDS, value)]
 
     def _map_logging_severity(self, severity: str) -> str:
         """Map Cloud Logging severity to standard severity levels"""
-        severity_map = {
-            'CRITICAL': 'critical',
-            'ERROR': 'high',
-            'WARNING': 'medium',
-            'INFO': 'low'
-        }
-        return severity_map.get(severity, 'low')
+        return LOGGING_SEVERITY_MAP.get(severity, 'low')
 
-    def parse_log(self, log: Dict[str, Any]) -> Dict[str, Any]:
+    def parse_log(self, log: LogRecord) -> LogRecord:
         """Parse and normalize a GCP log entry"""
         return log  # Already normalized in fetch methods 
\ No newline at end of file
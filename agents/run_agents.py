@@ -1,9 +1,12 @@
 import os
-import time
 import logging
-from typing import Dict, Type
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Type
 from dotenv import load_dotenv
+from pika.exceptions import AMQPConnectionError
 
+from analysis.message_bus import MessageBus
 from .base_agent import BaseLogAgent
 from .splunk.splunk_agent import SplunkAgent
 from .gcp.gcp_agent import GCPAgent
@@ -28,10 +31,19 @@ AGENTS: Dict[str, Type[BaseLogAgent]] = {
     # Add other agents here
 }
 
+# Number of logs published per broker transaction
+PUBLISH_BATCH_SIZE = int(os.getenv('PUBLISH_BATCH_SIZE', 100))
+
 class AgentRunner:
     def __init__(self):
         self.agents = {}
         self.running = True
+        self.message_bus = MessageBus(
+            host=os.getenv('RABBITMQ_HOST', 'localhost'),
+            port=int(os.getenv('RABBITMQ_PORT', 5672))
+        )
+        # Agents run on separate threads but share one blocking connection
+        self._publish_lock = threading.Lock()
         self._initialize_agents()
 
     def _initialize_agents(self):
@@ -52,21 +64,49 @@ class AgentRunner:
         agent = self.agents[agent_name]
         try:
             logger.info(f"Running {agent_name} agent")
-            logs = agent.run()
-            if logs:
-                logger.info(f"Collected {len(logs)} logs from {agent_name}")
-                # Process logs here (e.g., send to message bus)
+            # Stream logs to the bus as they are parsed rather than collecting
+            # the whole run first, publishing them in batches
+            count = 0
+            batch = []
+            for log in agent.run():
+                batch.append(log.as_dict())
+                if len(batch) >= PUBLISH_BATCH_SIZE:
+                    self._publish_logs(batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self._publish_logs(batch)
+                count += len(batch)
+            if count:
+                logger.info(f"Collected {count} logs from {agent_name}")
             else:
                 logger.info(f"No new logs from {agent_name}")
         except Exception as e:
             logger.error(f"Error running {agent_name} agent: {e}")
 
+    def _publish_logs(self, logs: List[Dict[str, Any]]):
+        """Publish a batch of logs to the logs queue"""
+        queue = self.message_bus.queues['logs']
+        with self._publish_lock:
+            try:
+                self.message_bus.publish_many(queue, logs)
+            except AMQPConnectionError as e:
+                # The broker dropped the connection, e.g. after missed
+                # heartbeats during a long fetch; reconnect and retry once
+                logger.warning(f"Lost connection to message bus, reconnecting: {e}")
+                self.message_bus.reconnect()
+                self.message_bus.publish_many(queue, logs)
+
     def run_all(self):
         """Run all agents"""
-        while self.running:
-            for agent_name in self.agents:
-                self.run_agent(agent_name)
-            time.sleep(60)  # Wait before next iteration
+        # Agents poll independent sources, so run them side by side and let
+        # a slow source delay only itself
+        with ThreadPoolExecutor(max_workers=max(1, len(self.agents))) as executor:
+            while self.running:
+                list(executor.map(self.run_agent, self.agents))
+                # Wait before next iteration, keeping the broker connection
+                # alive in the meantime
+                self.message_bus.sleep(60)
 
     def stop(self):
         """Stop all agents"""
@@ -76,6 +116,7 @@ class AgentRunner:
                 agent.disconnect()
             except Exception as e:
                 logger.error(f"Error disconnecting agent: {e}")
+        self.message_bus.close()
 
 def main():
     runner = AgentRunner()
@@ -1,9 +1,18 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, Any, Optional, Iterator
 from datetime import datetime, timedelta
+import logging
 import splunklib.client as splunk
+import splunklib.results as results
 from splunklib.client import Service
 import os
-from ..base_agent import BaseLogAgent
+import time
+from ..base_agent import BaseLogAgent, LogRecord, now_iso
+
+logger = logging.getLogger(__name__)
+
+# Backoff bounds in seconds when polling a non-blocking search job
+POLL_INITIAL_DELAY = 0.05
+POLL_MAX_DELAY = 1.0
 
 class SplunkAgent(BaseLogAgent):
     def __init__(self, config_path: str):
@@ -11,6 +20,9 @@ class SplunkAgent(BaseLogAgent):
         self.service = None
         self.index = self.config.get('index', 'main')
         self.search_interval = self.config.get('search_interval', 300)
+        # Long searches can outlive the HTTP request of a blocking job;
+        # set this to false to poll the job instead
+        self.blocking_search = self.config.get('blocking_search', True)
 
     def connect(self) -> bool:
         try:
@@ -22,7 +34,7 @@ class SplunkAgent(BaseLogAgent):
             )
             return True
         except Exception as e:
-            print(f"Failed to connect to Splunk: {e}")
+            logger.error("Failed to connect to Splunk: %s", e)
             return False
 
     def disconnect(self) -> None:
@@ -30,7 +42,7 @@ class SplunkAgent(BaseLogAgent):
             self.service.logout()
 
     def fetch_logs(self, start_time: Optional[datetime] = None,
-                  end_time: Optional[datetime] = None) -> List[Dict[str, Any]]:
+                  end_time: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
         if not start_time:
             start_time = datetime.now() - timedelta(seconds=self.search_interval)
         if not end_time:
@@ -39,43 +51,49 @@ class SplunkAgent(BaseLogAgent):
         search_query = f'search index={self.index} earliest={start_time.strftime("%Y-%m-%d %H:%M:%S")} latest={end_time.strftime("%Y-%m-%d %H:%M:%S")}'
         
         try:
-            job = self.service.jobs.create(search_query)
-            while not job.is_done():
-                time.sleep(1)
-            
+            # A blocking job returns once the search has finished, so there
+            # is no need to poll is_done()
+            if self.blocking_search:
+                job = self.service.jobs.create(search_query, exec_mode="blocking")
+            else:
+                job = self.service.jobs.create(search_query)
+                self._wait_for_job(job)
+
             result_count = int(job["resultCount"])
             if result_count == 0:
-                return []
+                return
 
-            result_stream = job.results(count=0)
-            logs = []
-            for result in result_stream:
-                logs.append(dict(result))
-            
-            return logs
+            # Stream the results as JSON; the reader also yields diagnostic
+            # messages, which are skipped
+            result_stream = job.results(count=0, output_mode="json")
+            for result in results.JSONResultsReader(result_stream):
+                if isinstance(result, dict):
+                    yield result
 
         except Exception as e:
-            print(f"Error fetching logs from Splunk: {e}")
-            return []
+            logger.exception("Error fetching logs from Splunk: %s", e)
 
-    def parse_log(self, log: Dict[str, Any]) -> Dict[str, Any]:
+    def _wait_for_job(self, job) -> None:
+        """Poll a search job with exponential backoff until it is done"""
+        delay = POLL_INITIAL_DELAY
+        while not job.is_done():
+            time.sleep(delay)
+            delay = min(delay * 2, POLL_MAX_DELAY)
+
+    def parse_log(self, log: Dict[str, Any]) -> LogRecord:
         """Parse and normalize a Splunk log entry"""
-        try:
-            return {
-                'timestamp': log.get('_time', datetime.now().isoformat()),
-                'source': log.get('source', 'unknown'),
-                'sourcetype': log.get('sourcetype', 'unknown'),
-                'host': log.get('host', 'unknown'),
-                'raw': log.get('_raw', ''),
-                'severity': log.get('severity', 'info'),
-                'event_type': log.get('eventtype', 'unknown'),
-                'source_ip': log.get('src_ip', ''),
-                'destination_ip': log.get('dest_ip', ''),
-                'user': log.get('user', ''),
-                'action': log.get('action', ''),
-                'status': log.get('status', ''),
-                'message': log.get('message', '')
-            }
-        except Exception as e:
-            print(f"Error parsing log: {e}")
-            return {} 
\ No newline at end of file
+        return LogRecord(
+            timestamp=log.get('_time') or now_iso(),
+            source=log.get('source', 'unknown'),
+            sourcetype=log.get('sourcetype', 'unknown'),
+            host=log.get('host', 'unknown'),
+            raw=log.get('_raw', ''),
+            severity=log.get('severity', 'info'),
+            event_type=log.get('eventtype', 'unknown'),
+            source_ip=log.get('src_ip', ''),
+            destination_ip=log.get('dest_ip', ''),
+            user=log.get('user', ''),
+            action=log.get('action', ''),
+            status=log.get('status', ''),
+            message=log.get('message', '')
+        )
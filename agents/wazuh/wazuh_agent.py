@@ -1,9 +1,25 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterator
 from datetime import datetime, timedelta
-import requests
-import json
+import logging
+from functools import partial
+import httpx
+import orjson
 import os
-from ..base_agent import BaseLogAgent
+import time
+from ..base_agent import BaseLogAgent, LogRecord, dig, dumps_raw, now_iso
+
+logger = logging.getLogger(__name__)
+
+# Wazuh API tokens expire after 900 seconds by default
+TOKEN_REFRESH_INTERVAL = 800
+
+# Severity for each Wazuh rule level (0-15); higher levels are critical
+MAX_RULE_LEVEL = 15
+RULE_LEVEL_SEVERITIES = ('low',) * 5 + ('medium',) * 5 + ('high',) * 5 + ('critical',)
+
+# Default index.max_result_window of the Wazuh indexer; from/size paging
+# cannot reach alerts past it
+MAX_RESULT_WINDOW = 10000
 
 class WazuhAgent(BaseLogAgent):
     def __init__(self, config_path: str):
@@ -13,98 +29,157 @@ class WazuhAgent(BaseLogAgent):
         self.cluster_name = self.config.get('cluster_name', 'wazuh-cluster')
         self.base_url = f"https://{self.config['host']}:{self.api_port}"
         self.session = None
+        self._token_time = 0.0
+        self.max_result_window = self.config.get('max_result_window', MAX_RESULT_WINDOW)
 
     def connect(self) -> bool:
         """Establish connection to Wazuh API"""
         try:
-            self.session = requests.Session()
-            self.session.verify = False  # For self-signed certificates
-            self.session.headers.update({
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json'
-            })
-            
-            # Test connection
-            response = self.session.get(f"{self.base_url}/security/user/authenticate")
-            response.raise_for_status()
+            # One HTTP/2 connection multiplexes the concurrent page requests
+            # of fetch_logs instead of opening a TLS connection per request
+            self.session = httpx.Client(
+                http2=True,
+                verify=False,  # For self-signed certificates
+                headers={'Content-Type': 'application/json'},
+                timeout=30.0,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+            )
+            self._authenticate()
             return True
         except Exception as e:
-            print(f"Failed to connect to Wazuh: {e}")
+            logger.error("Failed to connect to Wazuh: %s", e)
             return False
 
+    def _authenticate(self) -> None:
+        """Obtain an API token and use it for subsequent requests"""
+        response = self.session.get(
+            f"{self.base_url}/security/user/authenticate",
+            headers={'Authorization': f'Bearer {self.api_key}'}
+        )
+        response.raise_for_status()
+
+        token = dig(orjson.loads(response.content), 'data', 'token', default=self.api_key)
+        self.session.headers['Authorization'] = f'Bearer {token}'
+        self._token_time = time.monotonic()
+
+    def _refresh_token(self) -> None:
+        """Re-authenticate if the API token is about to expire"""
+        if time.monotonic() - self._token_time >= TOKEN_REFRESH_INTERVAL:
+            self._authenticate()
+
     def disconnect(self) -> None:
         """Close connection to Wazuh API"""
         if self.session:
             self.session.close()
 
     def fetch_logs(self, start_time: Optional[datetime] = None,
-                  end_time: Optional[datetime] = None) -> List[Dict[str, Any]]:
+                  end_time: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
         """Fetch logs from Wazuh API"""
         if not start_time:
             start_time = datetime.now() - timedelta(hours=1)
         if not end_time:
             end_time = datetime.now()
 
-        try:
-            # Query Wazuh API for alerts
-            query = {
-                "query": {
-                    "bool": {
-                        "must": [
-                            {"range": {"timestamp": {
-                                "gte": start_time.isoformat(),
-                                "lte": end_time.isoformat()
-                            }}}
-                        ]
-                    }
-                },
-                "sort": [{"timestamp": "asc"}],
-                "size": self.batch_size
-            }
-
-            response = self.session.post(
-                f"{self.base_url}/alerts",
-                json=query
-            )
-            response.raise_for_status()
-            
-            data = response.json()
-            return data.get('hits', {}).get('hits', [])
+        # Query Wazuh API for alerts
+        query = {
+            "query": {
+                "bool": {
+                    "must": [
+                        {"range": {"timestamp": {
+                            "gte": start_time.isoformat(),
+                            "lte": end_time.isoformat()
+                        }}}
+                    ]
+                }
+            },
+            "sort": [{"timestamp": "asc"}]
+        }
 
+        # Count the matching alerts first so every page can be requested
+        # concurrently
+        tasks = []
+        try:
+            self._refresh_token()
+            total = self._count_alerts(query)
+            if total > self.max_result_window:
+                # Offsets past the result window are rejected by the indexer;
+                # page through busy windows sequentially with search_after
+                tasks = [("Wazuh alerts", partial(self._fetch_after, query))]
+            else:
+                # The last page is trimmed so from + size stays within the
+                # result window
+                tasks = [
+                    (f"Wazuh alerts from offset {offset}",
+                     partial(self._fetch_page, query, offset, min(self.batch_size, total - offset)))
+                    for offset in range(0, total, self.batch_size)
+                ]
         except Exception as e:
-            print(f"Error fetching logs from Wazuh: {e}")
-            return []
+            logger.exception("Error fetching logs from Wazuh: %s", e)
+        return self._fetch_concurrently(tasks)
+
+    def _count_alerts(self, query: Dict[str, Any]) -> int:
+        """Return the number of alerts matching a query"""
+        response = self.session.post(
+            f"{self.base_url}/alerts",
+            json={**query, "size": 0}
+        )
+        response.raise_for_status()
+
+        total = orjson.loads(response.content).get('hits', {}).get('total', 0)
+        # Newer versions report the total as {"value": n, "relation": ...}
+        if isinstance(total, dict):
+            total = total.get('value', 0)
+        return total
+
+    def _fetch_page(self, query: Dict[str, Any], offset: int, size: int) -> Iterator[Dict[str, Any]]:
+        """Fetch one page of alerts matching a query"""
+        yield from self._search({**query, "from": offset, "size": size})
+
+    def _fetch_after(self, query: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Fetch all alerts matching a query, one page after another
 
-    def parse_log(self, log: Dict[str, Any]) -> Dict[str, Any]:
+        Each page resumes after the sort values of the previous page's last
+        hit, so there is no limit on how far the pages reach. The alert ID
+        breaks ties between alerts with the same timestamp.
+        """
+        body = {**query, "sort": query["sort"] + [{"id": "asc"}], "size": self.batch_size}
+        while True:
+            self._refresh_token()
+            hits = self._search(body)
+            yield from hits
+            if len(hits) < self.batch_size:
+                return
+            body["search_after"] = hits[-1].get('sort')
+            if not body["search_after"]:
+                logger.warning("Wazuh hits carry no sort values; stopping paging early")
+                return
+
+    def _search(self, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Run an alert search and return its hits"""
+        response = self.session.post(f"{self.base_url}/alerts", json=body)
+        response.raise_for_status()
+        return orjson.loads(response.content).get('hits', {}).get('hits', [])
+
+    def parse_log(self, log: Dict[str, Any]) -> LogRecord:
         """Parse and normalize a Wazuh log entry"""
-        try:
-            source = log.get('_source', {})
-            return {
-                'timestamp': source.get('timestamp', datetime.now().isoformat()),
-                'source': 'wazuh',
-                'agent': source.get('agent', {}).get('name', 'unknown'),
-                'rule': source.get('rule', {}).get('level', 'unknown'),
-                'severity': self._map_severity(source.get('rule', {}).get('level', 0)),
-                'event_type': source.get('rule', {}).get('description', 'unknown'),
-                'source_ip': source.get('sourceip', ''),
-                'destination_ip': source.get('destinationip', ''),
-                'user': source.get('data', {}).get('win', {}).get('eventdata', {}).get('user', ''),
-                'action': source.get('rule', {}).get('action', ''),
-                'status': source.get('rule', {}).get('status', ''),
-                'message': source.get('rule', {}).get('description', ''),
-                'raw': json.dumps(source)
-            }
-        except Exception as e:
-            print(f"Error parsing Wazuh log: {e}")
-            return {}
+        source = log.get('_source', {})
+        rule = source.get('rule', {})
+        return LogRecord(
+            timestamp=source.get('timestamp') or now_iso(),
+            source='wazuh',
+            agent=dig(source, 'agent', 'name', default='unknown'),
+            rule=rule.get('level', 'unknown'),
+            severity=self._map_severity(rule.get('level', 0)),
+            event_type=rule.get('description', 'unknown'),
+            source_ip=source.get('sourceip', ''),
+            destination_ip=source.get('destinationip', ''),
+            user=dig(source, 'data', 'win', 'eventdata', 'user'),
+            action=rule.get('action', ''),
+            status=rule.get('status', ''),
+            message=rule.get('description', ''),
+            raw=dumps_raw(source)
+        )
 
     def _map_severity(self, level: int) -> str:
         """Map Wazuh rule level to severity"""
-        if level >= 15:
-            return 'critical'
-        elif level >= 10:
-            return 'high'
-        elif level >= 5:
-            return 'medium'
-        else:
-            return 'low' 
\ No newline at end of file
+        return RULE_LEVEL_SEVERITIES[max(0, min(level, MAX_RULE_LEVEL))]
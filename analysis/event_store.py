@@ -0,0 +1,100 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Events up to this size (serialized) are still inlined into alerts
+MAX_INLINE_RAW_BYTES = 4096
+
+# Prefix of the Redis keys holding raw events
+REDIS_KEY_PREFIX = 'raw_event:'
+
+# Fields the message bus adds to queued events; they differ between
+# deliveries of the same event, so they are not stored
+TRANSPORT_FIELDS = ('published_at',)
+
+class EventStore:
+    """Store of raw events, keyed by content digest
+
+    Alerts carry a short reference to the raw event instead of the full
+    payload; identical events share a single entry. With a Redis client the
+    store is shared by all processes and entries expire after ttl seconds.
+    Without one, events are kept in this process only and the least
+    recently stored are evicted once max_events is reached.
+    """
+    def __init__(self, max_events: int = 10000, redis_client=None, ttl: int = 86400):
+        self.max_events = max_events
+        self.ttl = ttl
+        self._redis = redis_client
+        self._events = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self) -> bool:
+        """Whether references can be resolved by other processes"""
+        return self._redis is not None
+
+    def put(self, event: Dict[str, Any]) -> Tuple[str, bytes]:
+        """Store an event and return its reference and serialized form
+
+        Transport fields are left out, so they do not change the reference.
+        """
+        if any(field in event for field in TRANSPORT_FIELDS):
+            event = {k: v for k, v in event.items() if k not in TRANSPORT_FIELDS}
+        raw = orjson.dumps(event, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+        raw_ref = hashlib.blake2b(raw, digest_size=8).hexdigest()
+        if self._redis is not None:
+            self._redis.set(REDIS_KEY_PREFIX + raw_ref, raw, ex=self.ttl)
+            return raw_ref, raw
+
+        with self._lock:
+            self._events[raw_ref] = raw
+            self._events.move_to_end(raw_ref)
+            while len(self._events) > self.max_events:
+                self._events.popitem(last=False)
+        return raw_ref, raw
+
+    def get(self, raw_ref: str) -> Optional[Dict[str, Any]]:
+        """Return a stored event, or None if unknown or evicted"""
+        if self._redis is not None:
+            raw = self._redis.get(REDIS_KEY_PREFIX + raw_ref)
+        else:
+            with self._lock:
+                raw = self._events.get(raw_ref)
+        return None if raw is None else orjson.loads(raw)
+
+    def additional_info(self, event: Dict[str, Any], **info: Any) -> Dict[str, Any]:
+        """Build an alert's additional_info block referencing a raw event
+
+        The raw event is left out only when it is large and the store is
+        shared, so whoever reads the alert can still resolve the reference.
+        """
+        try:
+            raw_ref, raw = self.put(event)
+        except Exception as e:
+            logger.error("Failed to store raw event: %s", e)
+            info['raw_data'] = event
+            return info
+
+        info['raw_ref'] = raw_ref
+        if not self.shared or len(raw) <= MAX_INLINE_RAW_BYTES:
+            info['raw_data'] = event
+        return info
+
+def create_event_store() -> EventStore:
+    """Create an event store backed by Redis if REDIS_HOST is set,
+    otherwise one local to this process"""
+    max_events = int(os.getenv('EVENT_STORE_SIZE', 10000))
+    ttl = int(os.getenv('EVENT_STORE_TTL', 86400))
+    host = os.getenv('REDIS_HOST')
+    if not host:
+        return EventStore(max_events, ttl=ttl)
+
+    import redis
+    client = redis.Redis(host=host, port=int(os.getenv('REDIS_PORT', 6379)))
+    return EventStore(max_events, redis_client=client, ttl=ttl)
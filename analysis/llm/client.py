@@ -0,0 +1,87 @@
+import os
+import logging
+import threading
+import time
+from multiprocessing.connection import Client
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Connection attempts to the inference server and the backoff between
+# them in seconds; the server may still be starting or restarting
+CONNECT_ATTEMPTS = 10
+CONNECT_INITIAL_DELAY = 1.0
+CONNECT_MAX_DELAY = 30.0
+
+class LLMClient:
+    """Client for the shared LLM inference server
+
+    Exposes the analysis methods of LLMAnalysisEngine, so either can be
+    used by the API and the analysis runner.
+    """
+    def __init__(self, address: Tuple[str, int], authkey: bytes):
+        self.address = address
+        self._authkey = authkey
+        self._conn = self._connect()
+        # A connection carries one request/reply exchange at a time
+        self._lock = threading.Lock()
+        self.config = self._call('config')
+
+    def _connect(self):
+        """Connect to the server, retrying with exponential backoff"""
+        delay = CONNECT_INITIAL_DELAY
+        for attempt in range(CONNECT_ATTEMPTS):
+            try:
+                return Client(self.address, authkey=self._authkey)
+            except OSError as e:
+                if attempt == CONNECT_ATTEMPTS - 1:
+                    raise
+                logger.warning("LLM server at %s:%s not reachable (%s), retrying in %.1fs",
+                               *self.address, e, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, CONNECT_MAX_DELAY)
+
+    def _call(self, method: str, *args: Any) -> Any:
+        with self._lock:
+            try:
+                self._conn.send((method, args))
+                status, result = self._conn.recv()
+            except (EOFError, OSError) as e:
+                # The server restarted; reconnect and resend the request once
+                logger.warning("Lost connection to LLM server, reconnecting: %s", e)
+                self._conn.close()
+                self._conn = self._connect()
+                self._conn.send((method, args))
+                status, result = self._conn.recv()
+        if status == 'error':
+            raise RuntimeError(f"LLM server error in {method}: {result}")
+        return result
+
+    def analyze_security_event(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Analyze a security event using the LLM"""
+        return self.analyze_security_events_batch([event])[0]
+
+    def analyze_security_events_batch(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Analyze several security events with batched generation"""
+        return self._call('analyze_security_events_batch', events)
+
+    def summarize_incident(self, incident: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate an incident summary using the LLM"""
+        return self._call('summarize_incident', incident)
+
+    def close(self):
+        """Close the connection to the server"""
+        self._conn.close()
+
+def create_llm_engine(config_path: str):
+    """Connect to the shared inference server if one is configured,
+    otherwise load the model in this process"""
+    host = os.getenv('LLM_SERVER_HOST')
+    if not host:
+        from .engine import LLMAnalysisEngine
+        return LLMAnalysisEngine(config_path)
+
+    authkey = os.getenv('LLM_SERVER_AUTHKEY')
+    if not authkey:
+        raise ValueError("LLM_SERVER_AUTHKEY must be set")
+    return LLMClient((host, int(os.getenv('LLM_SERVER_PORT', 6000))), authkey.encode())
@@ -1,16 +1,100 @@
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
 import yaml
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+import copy
+import hashlib
+import logging
 import os
+import re
+import threading
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
+# Event fields that identify an event: the fields the prompt shows, except the
+# timestamp and the message. Events that agree on all of them and on their
+# normalized message share a cached analysis
+CACHE_KEY_FIELDS = ('source', 'event_type', 'severity', 'action', 'status',
+                    'user', 'source_ip', 'destination_ip')
+
+# Tokens that differ between otherwise identical event messages, such as the
+# eventID, requestID and eventTime of a raw CloudTrail record: UUIDs, ISO 8601
+# timestamps and long hexadecimal or decimal IDs
+VOLATILE_TOKEN_RE = re.compile(
+    r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b'
+    r'|\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?'
+    r'|\b[0-9a-f]{16,}\b'
+    r'|\b\d{6,}\b',
+    re.IGNORECASE
+)
+
+# Values the agents use for fields a source did not provide
+MISSING_FIELD_VALUES = (None, '', 'unknown', 'Unknown')
+
+# Section headers of the LLM responses. A line is a header if it mentions the
+# keyword anywhere; the alternatives are tried in order, so earlier sections
+# win when a line mentions several
+ANALYSIS_SECTION_RE = re.compile(
+    r'(?=.*(?P<severity>severity))'
+    r'|(?=.*(?P<impact>impact))'
+    r'|(?=.*(?P<recommendations>recommend))'
+    r'|(?=.*(?P<iocs>indicator))',
+    re.IGNORECASE
+)
+SUMMARY_SECTION_RE = re.compile(
+    r'(?=.*(?P<timeline>timeline))'
+    r'|(?=.*(?P<root_cause>root cause))'
+    r'|(?=.*(?P<impact>impact))'
+    r'|(?=.*(?P<remediation>remediation))',
+    re.IGNORECASE
+)
+
+# Prompt detail blocks, indented to match the prompt templates
+EVENT_DETAILS_TEMPLATE = """
+        Timestamp: {timestamp}
+        Source: {source}
+        Event Type: {event_type}
+        Severity: {severity}
+        Source IP: {source_ip}
+        Destination IP: {destination_ip}
+        User: {user}
+        Action: {action}
+        Status: {status}
+        Message: {message}
+        """
+INCIDENT_DETAILS_TEMPLATE = """
+        Incident ID: {id}
+        Start Time: {start_time}
+        End Time: {end_time}
+        Status: {status}
+        Events: {event_count}
+        Affected Systems: {affected_systems}
+        Description: {description}
+        """
+
+class UnknownDefault(dict):
+    """Mapping for the detail templates that fills in missing fields"""
+    def __missing__(self, key: str) -> str:
+        return 'unknown'
+
+# Quantization formats the vLLM backend can load directly
+VLLM_QUANTIZATIONS = ('awq', 'gptq', 'fp8')
+
 class LLMAnalysisEngine:
     def __init__(self, config_path: str):
         self.config = self._load_config(config_path)
         self.device = torch.device(self.config['inference']['device'])
         self.model = None
         self.tokenizer = None
+        self.backend = None
+        # Padded prompt lengths when the model is compiled
+        self._prompt_buckets = None
+        # LRU cache of analyses keyed by event signature
+        self._analysis_cache = OrderedDict()
+        self._cache_size = self.config['inference'].get('cache_size', 50000)
+        self._cache_lock = threading.Lock()
         self._load_model()
 
     def _load_config(self, config_path: str) -> Dict[str, Any]:
@@ -24,16 +108,49 @@ class LLMAnalysisEngine:
             model_config = self.config['model']
             model_path = os.getenv('MODEL_PATH', f"models/{model_config['name']}")
 
-            # Load tokenizer
+            self.backend = self.config['inference'].get('backend', 'transformers')
+            if self.backend == 'vllm':
+                self._load_vllm_model(model_path, model_config)
+                return
+
+            # Load tokenizer; decoder-only models need left padding so that
+            # generation continues directly from each prompt in a batch
             self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+            self.tokenizer.padding_side = 'left'
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
             
-            # Load model with quantization if specified
-            if model_config['quantization'] == 'int8':
+            # Load model with quantization if specified. Generation is bound
+            # by reading the weights for every token, so smaller weights
+            # translate almost directly into lower latency
+            quantization = model_config['quantization']
+            if quantization == 'nf4':
+                self.model = AutoModelForCausalLM.from_pretrained(
+                    model_path,
+                    quantization_config=BitsAndBytesConfig(
+                        load_in_4bit=True,
+                        bnb_4bit_quant_type='nf4',
+                        bnb_4bit_use_double_quant=True,
+                        bnb_4bit_compute_dtype=torch.bfloat16
+                    ),
+                    device_map='auto'
+                )
+            elif quantization == 'int8':
                 self.model = AutoModelForCausalLM.from_pretrained(
                     model_path,
                     load_in_8bit=True,
                     device_map='auto'
                 )
+            elif quantization == 'fp8':
+                # Quantizing to FP8 at load time needs a newer torch than
+                # the pinned one; vLLM loads pre-quantized FP8 checkpoints
+                raise ValueError("quantization: fp8 is only supported by the vllm backend")
+            elif quantization == 'bf16':
+                self.model = AutoModelForCausalLM.from_pretrained(
+                    model_path,
+                    torch_dtype=torch.bfloat16
+                )
+                self.model = self.model.to(self.device)
             else:
                 self.model = AutoModelForCausalLM.from_pretrained(model_path)
                 self.model = self.model.to(self.device)
@@ -43,39 +160,203 @@ class LLMAnalysisEngine:
             self.model.config.top_p = model_config['top_p']
             self.model.config.repetition_penalty = model_config['repetition_penalty']
 
+            if self.config['inference'].get('compile', False):
+                self._compile_model()
+
         except Exception as e:
-            print(f"Error loading model: {e}")
+            logger.error("Error loading model: %s", e)
             raise
 
+    def _compile_model(self):
+        """Compile the model's forward pass for CUDA graph replay
+
+        CUDA graphs need static shapes, so the KV cache is preallocated and
+        prompts are padded to one of inference.prompt_buckets lengths.
+        """
+        self._prompt_buckets = sorted(self.config['inference'].get('prompt_buckets', [128, 256, 512]))
+        self.model.generation_config.cache_implementation = 'static'
+        self.model.forward = torch.compile(self.model.forward, mode='reduce-overhead', dynamic=False)
+
+    def _load_vllm_model(self, model_path: str, model_config: Dict[str, Any]):
+        """Load the LLM into a vLLM engine"""
+        # vLLM is optional and only needed for this backend
+        from vllm import LLM, SamplingParams
+
+        # vLLM supports its own set of pre-quantized checkpoint formats
+        quantization = model_config['quantization']
+        self.model = LLM(
+            model=model_path,
+            quantization=quantization if quantization in VLLM_QUANTIZATIONS else None,
+            dtype='bfloat16',
+            gpu_memory_utilization=self.config['inference'].get('gpu_memory_utilization', 0.9),
+            max_model_len=model_config['max_length'],
+            # Every prompt starts with the same instructions from the prompt
+            # template; reuse their KV cache blocks across requests
+            enable_prefix_caching=True
+        )
+        # Generation stops at max_model_len, so max_length bounds the prompt
+        # and completion together as on the transformers backend
+        self._sampling_params = SamplingParams(
+            temperature=model_config['temperature'],
+            top_p=model_config['top_p'],
+            repetition_penalty=model_config['repetition_penalty'],
+            max_tokens=model_config['max_length']
+        )
+
     def analyze_security_event(self, event: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze a security event using the LLM"""
-        try:
-            # Prepare the prompt
-            prompt = self.config['prompts']['security_analysis'].format(
-                event_details=self._format_event_details(event)
+        return self.analyze_security_events_batch([event])[0]
+
+    def analyze_security_events_batch(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Analyze several security events with batched generation
+
+        Events whose signature was analyzed before are answered from the
+        cache, and events sharing a signature within the batch are analyzed
+        once. The remaining events are split into batches of at most
+        inference.max_batch_size and each batch is run through a single
+        generate() call, so the model weights are read once per token for
+        the whole batch.
+        """
+        results = [None] * len(events)
+        pending = OrderedDict()
+        for i, event in enumerate(events):
+            key = self._event_signature(event)
+            if key is None:
+                # Too few identifying fields to share an analysis safely;
+                # the index keeps the event apart from all others
+                pending[i] = (event, [i])
+                continue
+            cached = self._cache_get(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.setdefault(key, (event, []))[1].append(i)
+
+        keys = list(pending)
+        batch_size = self.config['inference'].get('max_batch_size', 32)
+        for start in range(0, len(keys), batch_size):
+            chunk = keys[start:start + batch_size]
+            try:
+                analyses = self._analyze_batch([pending[key][0] for key in chunk])
+                for key, analysis in zip(chunk, analyses):
+                    if isinstance(key, str):
+                        self._cache_put(key, analysis)
+            except Exception as e:
+                logger.exception("Error analyzing security events: %s", e)
+                analyses = [self._analysis_error() for _ in chunk]
+
+            for key, analysis in zip(chunk, analyses):
+                for i in pending[key][1]:
+                    results[i] = copy.deepcopy(analysis)
+        return results
+
+    def _analyze_batch(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Analyze one batch of security events"""
+        # Prepare the prompts
+        template = self.config['prompts']['security_analysis']
+        prompts = [
+            template.format(event_details=self._format_event_details(event))
+            for event in events
+        ]
+
+        # Generate and parse the responses
+        responses = self._generate(prompts)
+        return [self._parse_analysis_response(response) for response in responses]
+
+    def _generate(self, prompts: List[str]) -> List[str]:
+        """Generate a response for each prompt in a single batch
+
+        Each response includes its prompt, as the parsers expect.
+        """
+        if self.backend == 'vllm':
+            # vLLM schedules the prompts with continuous batching over a
+            # paged KV cache; it returns only the completions
+            outputs = self.model.generate(prompts, self._sampling_params, use_tqdm=False)
+            return [prompt + output.outputs[0].text for prompt, output in zip(prompts, outputs)]
+
+        if self._prompt_buckets:
+            inputs, length_args = self._tokenize_bucketed(prompts)
+        else:
+            inputs = self.tokenizer(
+                prompts,
+                return_tensors="pt",
+                padding=True,
+                truncation=True
             )
+            length_args = {'max_length': self.config['model']['max_length']}
 
-            # Generate analysis
-            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
+        inputs = inputs.to(self.device)
+        with torch.no_grad():
             outputs = self.model.generate(
                 **inputs,
-                max_length=self.config['model']['max_length'],
+                **length_args,
                 num_return_sequences=1,
-                pad_token_id=self.tokenizer.eos_token_id
+                pad_token_id=self.tokenizer.pad_token_id
             )
+        return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
 
-            # Parse the response
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            return self._parse_analysis_response(response)
+    def _tokenize_bucketed(self, prompts: List[str]):
+        """Tokenize prompts padded to the smallest bucket that fits them all
 
-        except Exception as e:
-            print(f"Error analyzing security event: {e}")
-            return {
-                'severity': 'unknown',
-                'impact': 'Error during analysis',
-                'recommendations': ['Investigate analysis error'],
-                'iocs': []
-            }
+        Returns the inputs and the generate() length arguments. The number of
+        new tokens is fixed, so every bucket keeps a single static shape.
+        """
+        largest = self._prompt_buckets[-1]
+        encoded = self.tokenizer(prompts, truncation=True, max_length=largest)
+        longest = max(len(ids) for ids in encoded['input_ids'])
+        bucket = next(b for b in self._prompt_buckets if b >= longest)
+
+        inputs = self.tokenizer.pad(
+            encoded,
+            padding='max_length',
+            max_length=bucket,
+            return_tensors="pt"
+        )
+        return inputs, {'max_new_tokens': self.config['inference'].get('max_new_tokens', 256)}
+
+    def _analysis_error(self) -> Dict[str, Any]:
+        """Analysis result returned when the LLM call fails"""
+        return {
+            'severity': 'unknown',
+            'impact': 'Error during analysis',
+            'recommendations': ['Investigate analysis error'],
+            'iocs': []
+        }
+
+    def _event_signature(self, event: Dict[str, Any]) -> Optional[str]:
+        """Fingerprint the identifying fields of an event, ignoring its
+        timestamp, raw data and the per-event IDs in its message
+
+        Returns None when most of the fields are missing, since such events
+        cannot be told apart and must not share an analysis.
+        """
+        message = event.get('message')
+        fields = tuple(event.get(field) for field in CACHE_KEY_FIELDS) + (message,)
+        present = sum(value not in MISSING_FIELD_VALUES for value in fields)
+        if present * 2 < len(fields):
+            return None
+        if message not in MISSING_FIELD_VALUES:
+            fields = fields[:-1] + (VOLATILE_TOKEN_RE.sub('#', str(message)),)
+        return hashlib.blake2b(repr(fields).encode(), digest_size=16).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of a cached analysis, marking it recently used"""
+        with self._cache_lock:
+            analysis = self._analysis_cache.get(key)
+            if analysis is None:
+                return None
+            self._analysis_cache.move_to_end(key)
+        return copy.deepcopy(analysis)
+
+    def _cache_put(self, key: str, analysis: Dict[str, Any]):
+        """Cache an analysis, evicting the least recently used entries"""
+        if self._cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._analysis_cache[key] = analysis
+            self._analysis_cache.move_to_end(key)
+            while len(self._analysis_cache) > self._cache_size:
+                self._analysis_cache.popitem(last=False)
 
     def summarize_incident(self, incident: Dict[str, Any]) -> Dict[str, Any]:
         """Generate an incident summary using the LLM"""
@@ -86,20 +367,13 @@ class LLMAnalysisEngine:
             )
 
             # Generate summary
-            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
-            outputs = self.model.generate(
-                **inputs,
-                max_length=self.config['model']['max_length'],
-                num_return_sequences=1,
-                pad_token_id=self.tokenizer.eos_token_id
-            )
+            response = self._generate([prompt])[0]
 
             # Parse the response
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
             return self._parse_summary_response(response)
 
         except Exception as e:
-            print(f"Error summarizing incident: {e}")
+            logger.exception("Error summarizing incident: %s", e)
             return {
                 'timeline': [],
                 'root_cause': 'Error during analysis',
@@ -109,97 +383,63 @@ class LLMAnalysisEngine:
 
     def _format_event_details(self, event: Dict[str, Any]) -> str:
         """Format event details for the prompt"""
-        return f"""
-        Timestamp: {event.get('timestamp', 'unknown')}
-        Source: {event.get('source', 'unknown')}
-        Event Type: {event.get('event_type', 'unknown')}
-        Severity: {event.get('severity', 'unknown')}
-        Source IP: {event.get('source_ip', 'unknown')}
-        Destination IP: {event.get('destination_ip', 'unknown')}
-        User: {event.get('user', 'unknown')}
-        Action: {event.get('action', 'unknown')}
-        Status: {event.get('status', 'unknown')}
-        Message: {event.get('message', 'unknown')}
-        """
+        return EVENT_DETAILS_TEMPLATE.format_map(UnknownDefault(event))
 
     def _format_incident_details(self, incident: Dict[str, Any]) -> str:
         """Format incident details for the prompt"""
-        return f"""
-        Incident ID: {incident.get('id', 'unknown')}
-        Start Time: {incident.get('start_time', 'unknown')}
-        End Time: {incident.get('end_time', 'unknown')}
-        Status: {incident.get('status', 'unknown')}
-        Events: {len(incident.get('events', []))}
-        Affected Systems: {', '.join(incident.get('affected_systems', []))}
-        Description: {incident.get('description', 'unknown')}
-        """
+        details = UnknownDefault(incident)
+        details['event_count'] = len(incident.get('events', []))
+        details['affected_systems'] = ', '.join(incident.get('affected_systems', []))
+        return INCIDENT_DETAILS_TEMPLATE.format_map(details)
 
     def _parse_analysis_response(self, response: str) -> Dict[str, Any]:
         """Parse the LLM's security analysis response"""
         # This is a simple parser - you might want to make it more robust
-        lines = response.split('\n')
-        result = {
-            'severity': 'unknown',
-            'impact': '',
-            'recommendations': [],
-            'iocs': []
-        }
+        severity = 'unknown'
+        sections = {'impact': [], 'recommendations': [], 'iocs': []}
 
         current_section = None
-        for line in lines:
+        for line in response.splitlines():
             line = line.strip()
             if not line:
                 continue
 
-            if 'severity' in line.lower():
-                result['severity'] = line.split(':')[-1].strip()
-            elif 'impact' in line.lower():
-                current_section = 'impact'
-            elif 'recommend' in line.lower():
-                current_section = 'recommendations'
-            elif 'indicator' in line.lower():
-                current_section = 'iocs'
-            elif current_section == 'impact':
-                result['impact'] += line + ' '
-            elif current_section == 'recommendations':
-                result['recommendations'].append(line)
-            elif current_section == 'iocs':
-                result['iocs'].append(line)
-
-        return result
+            header = ANALYSIS_SECTION_RE.match(line)
+            if header is None:
+                if current_section:
+                    sections[current_section].append(line)
+            elif header.lastgroup == 'severity':
+                severity = line.rpartition(':')[2].strip()
+            else:
+                current_section = header.lastgroup
+
+        return {
+            'severity': severity,
+            'impact': ' '.join(sections['impact']),
+            'recommendations': sections['recommendations'],
+            'iocs': sections['iocs']
+        }
 
     def _parse_summary_response(self, response: str) -> Dict[str, Any]:
         """Parse the LLM's incident summary response"""
         # This is a simple parser - you might want to make it more robust
-        lines = response.split('\n')
-        result = {
-            'timeline': [],
-            'root_cause': '',
-            'impact': '',
-            'remediation': []
-        }
+        sections = {'timeline': [], 'root_cause': [], 'impact': [], 'remediation': []}
 
         current_section = None
-        for line in lines:
+        for line in response.splitlines():
             line = line.strip()
             if not line:
                 continue
 
-            if 'timeline' in line.lower():
-                current_section = 'timeline'
-            elif 'root cause' in line.lower():
-                current_section = 'root_cause'
-            elif 'impact' in line.lower():
-                current_section = 'impact'
-            elif 'remediation' in line.lower():
-                current_section = 'remediation'
-            elif current_section == 'timeline':
-                result['timeline'].append(line)
-            elif current_section == 'root_cause':
-                result['root_cause'] += line + ' '
-            elif current_section == 'impact':
-                result['impact'] += line + ' '
-            elif current_section == 'remediation':
-                result['remediation'].append(line)
-
-        return result 
\ No newline at end of file
+            header = SUMMARY_SECTION_RE.match(line)
+            if header is not None:
+                current_section = header.lastgroup
+            elif current_section:
+                sections[current_section].append(line)
+
+        return {
+            'timeline': sections['timeline'],
+            'root_cause': ' '.join(sections['root_cause']),
+            'impact': ' '.join(sections['impact']),
+            'remediation': sections['remediation']
+        }
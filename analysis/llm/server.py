@@ -0,0 +1,147 @@
+import os
+import logging
+import queue
+import threading
+from multiprocessing.connection import Listener
+from typing import List, Tuple
+
+from .engine import LLMAnalysisEngine
+
+logger = logging.getLogger(__name__)
+
+class InferenceServer:
+    """Owns the LLM and serves analysis requests from other processes
+
+    The API and the analysis runner both connect here, so the model weights
+    are loaded once. Analysis requests that arrive while the model is busy
+    are merged into a single batch, across all connected clients.
+    """
+    def __init__(self, config_path: str, address: Tuple[str, int], authkey: bytes):
+        # Listen before loading the model: clients that start meanwhile
+        # wait in the accept backlog instead of being refused
+        self.listener = Listener(address, backlog=16, authkey=authkey)
+        self.engine = LLMAnalysisEngine(config_path)
+        self._requests = queue.Queue()
+
+    def serve_forever(self):
+        """Accept client connections until the process is stopped"""
+        threading.Thread(target=self._run_inference, daemon=True).start()
+        logger.info("LLM inference server listening on %s", self.listener.address)
+        while True:
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                logger.error("Failed to accept connection: %s", e)
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        """Answer the requests of a single client connection"""
+        with conn:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except EOFError:
+                    return
+
+                if method == 'config':
+                    reply = ('ok', self.engine.config)
+                else:
+                    done = threading.Event()
+                    request = {'method': method, 'args': args, 'done': done}
+                    self._requests.put(request)
+                    done.wait()
+                    reply = request['reply']
+                conn.send(reply)
+
+    def _run_inference(self):
+        """Run queued requests on the model, batching analyses together"""
+        while True:
+            pending = [self._requests.get()]
+            while True:
+                try:
+                    pending.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._serve(pending)
+            except Exception as e:
+                logger.exception("Error serving requests: %s", e)
+                # Clients wait for a reply, so every request gets one
+                for request in pending:
+                    if not request['done'].is_set():
+                        request['reply'] = ('error', str(e))
+                        request['done'].set()
+
+    def _serve(self, pending: List[dict]):
+        """Answer a group of requests taken from the queue"""
+        batched = [r for r in pending if r['method'] == 'analyze_security_events_batch']
+        if batched:
+            self._analyze(batched)
+
+        for request in pending:
+            if request['method'] == 'analyze_security_events_batch':
+                continue
+            try:
+                if request['method'] != 'summarize_incident':
+                    raise ValueError(f"Unknown method: {request['method']}")
+                request['reply'] = ('ok', self.engine.summarize_incident(*request['args']))
+            except Exception as e:
+                logger.exception("Error serving %s: %s", request['method'], e)
+                request['reply'] = ('error', str(e))
+            request['done'].set()
+
+    def _analyze(self, requests: List[dict]):
+        """Analyze the events of several requests in one engine call"""
+        # A malformed request is answered with an error on its own rather
+        # than failing the whole batch
+        batch = []
+        events = []
+        for request in requests:
+            try:
+                request_events = list(request['args'][0])
+            except Exception as e:
+                logger.error("Malformed analysis request: %s", e)
+                request['reply'] = ('error', f"Malformed analysis request: {e}")
+                request['done'].set()
+                continue
+            batch.append((request, len(request_events)))
+            events.extend(request_events)
+        if not batch:
+            return
+
+        try:
+            analyses = self.engine.analyze_security_events_batch(events)
+            start = 0
+            for request, count in batch:
+                request['reply'] = ('ok', analyses[start:start + count])
+                start += count
+        except Exception as e:
+            logger.exception("Error analyzing security events: %s", e)
+            for request, _ in batch:
+                request['reply'] = ('error', str(e))
+        for request, _ in batch:
+            request['done'].set()
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    authkey = os.getenv('LLM_SERVER_AUTHKEY')
+    if not authkey:
+        raise ValueError("LLM_SERVER_AUTHKEY must be set")
+
+    server = InferenceServer(
+        'config/llm.yaml',
+        address=('0.0.0.0', int(os.getenv('LLM_SERVER_PORT', 6000))),
+        authkey=authkey.encode()
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopping LLM inference server")
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,23 @@
 import pika
-import json
-from typing import Callable, Dict, Any
+from pika.exceptions import AMQPConnectionError
+import orjson
+import logging
+from typing import Callable, Dict, Any, List, Optional
 import os
-from datetime import datetime
+import time
+
+from agents.base_agent import now_iso
+
+logger = logging.getLogger(__name__)
+
+# Messages survive a broker restart
+PERSISTENT = pika.BasicProperties(delivery_mode=2)
 
 class MessageBus:
     def __init__(self, host: str = 'localhost', port: int = 5672):
         self.connection = None
         self.channel = None
+        self._batch_channel = None
         self.host = host
         self.port = port
         self.queues = {
@@ -32,9 +42,13 @@ class MessageBus:
             )
             self.connection = pika.BlockingConnection(parameters)
             self.channel = self.connection.channel()
+            # Batches are published in transactions on their own channel, so
+            # the broker persists a whole batch in one commit
+            self._batch_channel = self.connection.channel()
+            self._batch_channel.tx_select()
             self._setup_queues()
         except Exception as e:
-            print(f"Failed to connect to RabbitMQ: {e}")
+            logger.error("Failed to connect to RabbitMQ: %s", e)
             raise
 
     def _setup_queues(self):
@@ -48,19 +62,59 @@ class MessageBus:
             if queue not in self.queues.values():
                 raise ValueError(f"Invalid queue: {queue}")
 
-            message['timestamp'] = datetime.now().isoformat()
+            # Kept apart from the payload's own timestamp, which is the time
+            # of the event itself
+            message['published_at'] = now_iso()
             self.channel.basic_publish(
                 exchange='',
                 routing_key=queue,
-                body=json.dumps(message),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # make message persistent
-                )
+                body=orjson.dumps(message),
+                properties=PERSISTENT
             )
         except Exception as e:
-            print(f"Failed to publish message: {e}")
+            logger.error("Failed to publish message: %s", e)
             raise
 
+    def publish_many(self, queue: str, messages: List[Dict[str, Any]]):
+        """Publish a batch of messages to a queue in a single transaction
+
+        The broker acknowledges the whole batch at once on commit, instead
+        of the publisher paying a round-trip per message.
+        """
+        try:
+            if queue not in self.queues.values():
+                raise ValueError(f"Invalid queue: {queue}")
+            if not messages:
+                return
+
+            published_at = now_iso()
+            try:
+                for message in messages:
+                    message['published_at'] = published_at
+                    self._batch_channel.basic_publish(
+                        exchange='',
+                        routing_key=queue,
+                        body=orjson.dumps(message),
+                        properties=PERSISTENT
+                    )
+                self._batch_channel.tx_commit()
+            except Exception:
+                # Discard the part of the batch already published, so it is
+                # not committed along with the next batch
+                self._rollback_batch()
+                raise
+        except Exception as e:
+            logger.error("Failed to publish messages: %s", e)
+            raise
+
+    def _rollback_batch(self):
+        """Roll back the open transaction on the batch channel"""
+        try:
+            if self._batch_channel is not None and self._batch_channel.is_open:
+                self._batch_channel.tx_rollback()
+        except Exception as e:
+            logger.error("Failed to roll back message batch: %s", e)
+
     def consume(self, queue: str, callback: Callable[[Dict[str, Any]], None]):
         """Consume messages from a queue"""
         try:
@@ -69,11 +123,11 @@ class MessageBus:
 
             def _callback(ch, method, properties, body):
                 try:
-                    message = json.loads(body)
+                    message = orjson.loads(body)
                     callback(message)
                     ch.basic_ack(delivery_tag=method.delivery_tag)
                 except Exception as e:
-                    print(f"Error processing message: {e}")
+                    logger.exception("Error processing message: %s", e)
                     ch.basic_nack(delivery_tag=method.delivery_tag)
 
             self.channel.basic_qos(prefetch_count=1)
@@ -83,9 +137,80 @@ class MessageBus:
             )
             self.channel.start_consuming()
         except Exception as e:
-            print(f"Failed to consume messages: {e}")
+            logger.error("Failed to consume messages: %s", e)
+            raise
+
+    def consume_batches(self, queue: str, callback: Callable[[List[Dict[str, Any]]], None],
+                        batch_size: int = 32, timeout: float = 1.0,
+                        prefetch_count: Optional[int] = None):
+        """Consume messages from a queue in batches
+
+        The callback receives up to batch_size messages at a time. A partial
+        batch is delivered once its first message has waited about timeout
+        seconds. Each batch is acked, or nacked on error, as a whole.
+        prefetch_count defaults to two batches, so the broker keeps
+        delivering the next batch while the callback processes the current
+        one.
+        """
+        try:
+            if queue not in self.queues.values():
+                raise ValueError(f"Invalid queue: {queue}")
+
+            messages = []
+            last_tag = None
+            deadline = None
+
+            def flush(messages: List[Dict[str, Any]], last_tag: int):
+                try:
+                    callback(messages)
+                    self.channel.basic_ack(delivery_tag=last_tag, multiple=True)
+                except Exception as e:
+                    logger.exception("Error processing batch: %s", e)
+                    self.channel.basic_nack(delivery_tag=last_tag, multiple=True)
+
+            self.channel.basic_qos(prefetch_count=prefetch_count or 2 * batch_size)
+            for method, properties, body in self.channel.consume(queue, inactivity_timeout=timeout):
+                if method is not None:
+                    try:
+                        messages.append(orjson.loads(body))
+                        last_tag = method.delivery_tag
+                        if deadline is None:
+                            deadline = time.monotonic() + timeout
+                    except Exception as e:
+                        logger.error("Error decoding message: %s", e)
+                        self.channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+                if messages and (len(messages) >= batch_size or time.monotonic() >= deadline):
+                    flush(messages, last_tag)
+                    messages = []
+                    deadline = None
+        except Exception as e:
+            logger.error("Failed to consume messages: %s", e)
             raise
 
+    def reconnect(self):
+        """Replace a dropped connection with a new one"""
+        try:
+            self.close()
+        except Exception as e:
+            logger.debug("Error closing stale RabbitMQ connection: %s", e)
+        self.connect()
+
+    def sleep(self, seconds: float):
+        """Wait while servicing the connection
+
+        A BlockingConnection only answers broker heartbeats while its I/O
+        loop runs, so idle publishers should wait here rather than in
+        time.sleep. A dropped connection is left for the next publish to
+        re-establish.
+        """
+        deadline = time.monotonic() + seconds
+        try:
+            self.connection.sleep(seconds)
+        except AMQPConnectionError as e:
+            logger.warning("Lost connection to RabbitMQ: %s", e)
+            time.sleep(max(0.0, deadline - time.monotonic()))
+
     def close(self):
         """Close the connection"""
         if self.connection and not self.connection.is_closed:
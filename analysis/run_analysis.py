@@ -1,10 +1,11 @@
 import os
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List
 from dotenv import load_dotenv
 
-from .llm.engine import LLMAnalysisEngine
+from .llm.client import create_llm_engine
 from .message_bus import MessageBus
+from .event_store import create_event_store
 from notifications.notifier import Notifier
 
 # Configure logging
@@ -23,17 +24,44 @@ class AnalysisRunner:
             host=os.getenv('RABBITMQ_HOST', 'localhost'),
             port=int(os.getenv('RABBITMQ_PORT', 5672))
         )
-        self.llm_engine = LLMAnalysisEngine('config/llm.yaml')
+        # Uses the shared inference server when LLM_SERVER_HOST is set
+        self.llm_engine = create_llm_engine('config/llm.yaml')
         self.notifier = Notifier('config/notifications.yaml')
+        # Shared with the API through Redis, so its raw_refs resolve there
+        self.event_store = create_event_store()
 
     def process_event(self, event: Dict[str, Any]):
         """Process a security event"""
+        self.process_events([event])
+
+    def process_events(self, events: List[Dict[str, Any]]):
+        """Process a batch of security events"""
+        try:
+            # Analyze the whole batch with a single LLM pass
+            analyses = self.llm_engine.analyze_security_events_batch(events)
+            logger.info(f"Analyzed batch of {len(events)} events")
+        except Exception as e:
+            logger.error(f"Error analyzing events: {e}")
+            return
+
+        results = []
+        for event, analysis in zip(events, analyses):
+            self._alert_if_severe(event, analysis)
+            results.append({
+                'event_id': event.get('id'),
+                'analysis': analysis
+            })
+
+        # Publish the analysis results in a single transaction
         try:
-            # Analyze event using LLM
-            analysis = self.llm_engine.analyze_security_event(event)
-            logger.info(f"Analyzed event {event.get('id', 'unknown')}")
+            self.message_bus.publish_many('security_analysis', results)
+            logger.info(f"Published analyses for {len(results)} events")
+        except Exception as e:
+            logger.error(f"Error publishing analyses: {e}")
 
-            # Send alert if severity is high enough
+    def _alert_if_severe(self, event: Dict[str, Any], analysis: Dict[str, Any]):
+        """Send an alert if the analysis of a security event is severe enough"""
+        try:
             if analysis['severity'] in ['critical', 'high']:
                 alert = {
                     'title': f"Security Event: {event.get('event_type', 'Unknown')}",
@@ -42,41 +70,43 @@ class AnalysisRunner:
                     'description': event.get('description', 'No description'),
                     'impact': analysis['impact'],
                     'recommendations': analysis['recommendations'],
-                    'additional_info': {
-                        'raw_data': event,
-                        'iocs': analysis['iocs']
-                    }
+                    'additional_info': self._additional_info(event, analysis['iocs'])
                 }
+                # Queued for the notifier's sender thread, so slow Slack/SMTP
+                # calls overlap with LLM inference on the next batch
                 self.notifier.send_alert(alert)
-                logger.info(f"Sent alert for event {event.get('id', 'unknown')}")
-
-            # Publish analysis results
-            self.message_bus.publish(
-                'security_analysis',
-                {
-                    'event_id': event.get('id'),
-                    'analysis': analysis
-                }
-            )
-            logger.info(f"Published analysis for event {event.get('id', 'unknown')}")
+                logger.info(f"Queued alert for event {event.get('id', 'unknown')}")
 
         except Exception as e:
             logger.error(f"Error processing event: {e}")
 
+    def _additional_info(self, event: Dict[str, Any], iocs: List[Any]) -> Dict[str, Any]:
+        """Build an alert's additional_info block"""
+        if not self.event_store.shared:
+            # No other process can resolve references into a local store,
+            # so the raw event is only inlined, not stored
+            return {'iocs': iocs, 'raw_data': event}
+        return self.event_store.additional_info(event, iocs=iocs)
+
     def run(self):
         """Run the analysis engine"""
         try:
             logger.info("Starting analysis engine")
-            
-            def process_message(message: Dict[str, Any]):
-                self.process_event(message)
+            inference = self.llm_engine.config['inference']
 
-            # Consume messages from the security_logs queue
-            self.message_bus.consume('security_logs', process_message)
+            # Consume messages from the security_logs queue in micro-batches
+            # so the LLM can analyze several events per generate() call
+            self.message_bus.consume_batches(
+                'security_logs',
+                self.process_events,
+                batch_size=inference.get('max_batch_size', 32),
+                timeout=inference.get('batch_timeout', 1.0)
+            )
 
         except Exception as e:
             logger.error(f"Error in analysis engine: {e}")
         finally:
+            self.notifier.close()
             self.message_bus.close()
 
 def main():
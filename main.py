@@ -1,15 +1,17 @@
 import os
+import asyncio
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable
 import uvicorn
 from dotenv import load_dotenv
 
 from agents.splunk.splunk_agent import SplunkAgent
 from agents.gcp.gcp_agent import GCPAgent
 from agents.azure.azure_agent import AzureAgent
-from analysis.llm.engine import LLMAnalysisEngine
+from analysis.llm.client import create_llm_engine
 from analysis.message_bus import MessageBus
+from analysis.event_store import create_event_store
 from notifications.notifier import Notifier
 
 # Load environment variables
@@ -22,22 +24,129 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Initialize components
-message_bus = MessageBus(
-    host=os.getenv('RABBITMQ_HOST', 'localhost'),
-    port=int(os.getenv('RABBITMQ_PORT', 5672))
-)
+# Components are created in the startup hook, so each Uvicorn worker process
+# builds its own and importing the module stays cheap
+message_bus = None
+llm_engine = None
+notifier = None
+event_store = None
+log_agents = {}
+analysis_batcher = None
+agent_prober = None
+
+# Seconds between probes of the log sources reported by /health
+AGENT_PROBE_INTERVAL = 60
+
+class AnalysisBatcher:
+    """Collect concurrent analysis requests into batched LLM calls
+
+    Requests are queued and a single background task drains the queue,
+    waiting up to window seconds for up to max_batch_size events, then runs
+    the blocking batch analysis on a worker thread so the event loop stays
+    responsive.
+    """
+    def __init__(self, analyze_batch: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+                 max_batch_size: int, window: float):
+        self.analyze_batch = analyze_batch
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        """Start the batching task on the running event loop"""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching task"""
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    async def analyze(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Analyze an event as part of the next batch"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((event, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                analyses = await asyncio.to_thread(
+                    self.analyze_batch, [event for event, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
 
-llm_engine = LLMAnalysisEngine('config/llm.yaml')
-notifier = Notifier('config/notifications.yaml')
+            for (_, future), analysis in zip(batch, analyses):
+                if not future.done():
+                    future.set_result(analysis)
 
-# Initialize log agents
-log_agents = {
-    'splunk': SplunkAgent('config/log_sources.yaml'),
-    'gcp': GCPAgent('config/log_sources.yaml'),
-    'azure': AzureAgent('config/log_sources.yaml')
-    # Add other agents here
-}
+async def probe_agents():
+    """Refresh the connection state of the log agents in the background,
+    so status requests never open connections to the sources"""
+    while True:
+        await asyncio.gather(
+            *(asyncio.to_thread(agent.probe) for agent in log_agents.values())
+        )
+        await asyncio.sleep(AGENT_PROBE_INTERVAL)
+
+@app.on_event("startup")
+async def startup():
+    global message_bus, llm_engine, notifier, event_store, log_agents, analysis_batcher, agent_prober
+
+    # Initialize components
+    message_bus = MessageBus(
+        host=os.getenv('RABBITMQ_HOST', 'localhost'),
+        port=int(os.getenv('RABBITMQ_PORT', 5672))
+    )
+
+    # Uses the shared inference server when LLM_SERVER_HOST is set
+    llm_engine = create_llm_engine('config/llm.yaml')
+    notifier = Notifier('config/notifications.yaml')
+    # Shared through Redis when REDIS_HOST is set
+    event_store = create_event_store()
+
+    # Initialize log agents
+    log_agents = {
+        'splunk': SplunkAgent('config/log_sources.yaml'),
+        'gcp': GCPAgent('config/log_sources.yaml'),
+        'azure': AzureAgent('config/log_sources.yaml')
+        # Add other agents here
+    }
+
+    analysis_batcher = AnalysisBatcher(
+        llm_engine.analyze_security_events_batch,
+        max_batch_size=llm_engine.config['inference'].get('max_batch_size', 32),
+        window=0.01
+    )
+    analysis_batcher.start()
+    agent_prober = asyncio.create_task(probe_agents())
+
+@app.on_event("shutdown")
+async def stop_analysis_batcher():
+    agent_prober.cancel()
+    await analysis_batcher.stop()
+    notifier.close()
 
 class SecurityEvent(BaseModel):
     source: str
@@ -57,12 +166,17 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    # Agents may override get_status with blocking calls, so status is
+    # read on worker threads
+    statuses = await asyncio.gather(
+        *(asyncio.to_thread(agent.get_status) for agent in log_agents.values())
+    )
     return {
         "status": "healthy",
         "components": {
             "message_bus": message_bus.connection is not None,
-            "llm_engine": llm_engine.model is not None,
-            "log_agents": {name: agent.get_status() for name, agent in log_agents.items()}
+            "llm_engine": llm_engine is not None,
+            "log_agents": dict(zip(log_agents, statuses))
         }
     }
 
@@ -70,7 +184,7 @@ async def health_check():
 async def process_event(event: SecurityEvent):
     try:
         # Analyze event using LLM
-        analysis = llm_engine.analyze_security_event(event.dict())
+        analysis = await analysis_batcher.analyze(event.dict())
         
         # Send alert if severity is high enough
         if analysis['severity'] in ['critical', 'high']:
@@ -81,10 +195,12 @@ async def process_event(event: SecurityEvent):
                 'description': event.description,
                 'impact': analysis['impact'],
                 'recommendations': analysis['recommendations'],
-                'additional_info': {
-                    'raw_data': event.raw_data,
-                    'iocs': analysis['iocs']
-                }
+                # Storing the raw event may write to Redis
+                'additional_info': await asyncio.to_thread(
+                    event_store.additional_info,
+                    event.raw_data,
+                    iocs=analysis['iocs']
+                )
             }
             notifier.send_alert(alert)
         
@@ -99,7 +215,7 @@ async def process_event(event: SecurityEvent):
 @app.post("/analyze")
 async def analyze_event(request: AnalysisRequest):
     try:
-        analysis = llm_engine.analyze_security_event(request.raw_data)
+        analysis = await analysis_batcher.analyze(request.raw_data)
         return {
             "status": "success",
             "event_id": request.event_id,
@@ -108,16 +224,27 @@ async def analyze_event(request: AnalysisRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/events/raw/{raw_ref}")
+async def get_raw_event(raw_ref: str):
+    raw_data = await asyncio.to_thread(event_store.get, raw_ref)
+    if raw_data is None:
+        raise HTTPException(status_code=404, detail="Raw event not found")
+    return raw_data
+
 @app.get("/agents/{agent_name}/status")
 async def get_agent_status(agent_name: str):
     if agent_name not in log_agents:
         raise HTTPException(status_code=404, detail="Agent not found")
-    return log_agents[agent_name].get_status()
+    return await asyncio.to_thread(log_agents[agent_name].get_status)
 
 if __name__ == "__main__":
+    # Without a shared inference server every worker loads its own copy of
+    # the LLM, so only raise API_WORKERS when the GPU has room for them
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8080,
-        reload=True
-    ) 
\ No newline at end of file
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv('API_WORKERS', 1))
+    )
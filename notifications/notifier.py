@@ -1,12 +1,80 @@
 import os
+import logging
 from typing import Dict, Any, List
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from email.message import EmailMessage
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+import yaml
+import functools
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+# Recycle the SMTP session after this many messages; servers commonly
+# cap the number of messages per connection
+SMTP_MAX_MESSAGES_PER_CONNECTION = 1000
+
+# Timeouts in seconds, so a hung Slack endpoint or SMTP server cannot
+# stall the sender thread indefinitely
+SLACK_TIMEOUT = (5, 30)  # (connect, read)
+SMTP_TIMEOUT = 30
+
+# Attempts per email when the SMTP connection drops, and the base of the
+# exponential backoff between them
+SMTP_SEND_ATTEMPTS = 3
+RETRY_BACKOFF = 0.2
+
+# Alerts waiting for the background sender, and how many of them are
+# sent together
+ALERT_QUEUE_SIZE = 10000
+ALERT_BATCH_SIZE = 64
+
+# Queued by close() to stop the background sender
+_STOP = object()
+
+SEVERITY_COLORS = {
+    'critical': '#FF0000',
+    'high': '#FFA500',
+    'medium': '#FFFF00',
+    'low': '#00FF00'
+}
+
+EMAIL_BODY_TEMPLATE = """
+        Security Alert Details:
+        
+        Title: {title}
+        Severity: {severity}
+        Source: {source}
+        Timestamp: {timestamp}
+        
+        Description:
+        {description}
+        
+        Impact:
+        {impact}
+        
+        Recommendations:
+        {recommendations}
+        
+        Additional Information:
+        {additional_info}
+        """
+
+@functools.lru_cache(maxsize=8)
+def _read_config(config_path: str, mtime: float) -> Dict[str, Any]:
+    """Parse a notification config file; the mtime in the cache key
+    makes edits to the file take effect"""
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f)
+
 class Notifier:
     def __init__(self, config_path: str):
         self.config = self._load_config(config_path)
@@ -18,135 +86,322 @@ class Notifier:
             'password': os.getenv('SMTP_PASSWORD'),
             'from_email': os.getenv('FROM_EMAIL')
         }
+        # Senders for the channels that are configured, checked once here
+        # rather than on every alert
+        self._channel_senders = {}
+        if self.slack_webhook_url:
+            self._channel_senders['slack'] = self._send_slack_alerts
+        else:
+            logger.warning("Slack webhook URL not configured; Slack alerts are disabled")
+        if self.smtp_config['username'] and self.smtp_config['password']:
+            self._channel_senders['email'] = self._send_email_alerts
+        else:
+            logger.warning("SMTP credentials not configured; email alerts are disabled")
+        # Keep-alive HTTP session so Slack posts reuse one TLS connection
+        self._http = requests.Session()
+        self._http.mount('https://', HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=8,
+            max_retries=Retry(
+                total=2,
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['POST']
+            )
+        ))
+        # Channels are independent, so an alert is sent to all of them at
+        # once instead of waiting on Slack before starting the email
+        self._channel_executor = ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix='notifier'
+        )
+        # SMTP session shared across alerts, opened on first use
+        self._smtp = None
+        self._smtp_sent = 0
+        self._smtp_lock = threading.Lock()
+        # send_alert only queues the alert; a background thread sends
+        # queued alerts in batches so callers never wait on Slack or SMTP
+        self._alerts = queue.Queue(maxsize=ALERT_QUEUE_SIZE)
+        self.dropped_alerts = 0
+        self._dropped_lock = threading.Lock()
+        # Set by close(); guarded by _closed_lock so no alert is queued
+        # behind the sender's stop marker
+        self._closed = False
+        self._closed_lock = threading.Lock()
+        self._sender = threading.Thread(
+            target=self._send_queued_alerts, name='notifier-sender', daemon=True
+        )
+        self._sender.start()
 
     def _load_config(self, config_path: str) -> Dict[str, Any]:
         """Load notification configuration"""
-        with open(config_path, 'r') as f:
-            return json.load(f)
+        return _read_config(config_path, os.path.getmtime(config_path))
 
     def send_alert(self, alert: Dict[str, Any], channels: List[str] = None):
-        """Send alert through specified channels"""
+        """Queue alert to be sent through specified channels
+
+        Returns immediately; the alert is sent by the background sender.
+        If ALERT_QUEUE_SIZE alerts are already waiting, because Slack or
+        SMTP is stalled, or the notifier was closed, the alert is dropped
+        and counted in dropped_alerts rather than blocking the caller.
+        """
+        with self._closed_lock:
+            if self._closed:
+                reason = "Notifier closed"
+            else:
+                try:
+                    self._alerts.put_nowait((alert, channels))
+                    return
+                except queue.Full:
+                    reason = "Alert queue full"
+        with self._dropped_lock:
+            self.dropped_alerts += 1
+            dropped = self.dropped_alerts
+        logger.error("%s, dropped alert %r (%d dropped so far)",
+                     reason, alert.get('title', 'Unknown Alert'), dropped)
+
+    def _send_queued_alerts(self):
+        """Send queued alerts in batches until close() is called"""
+        stopping = False
+        while not stopping:
+            item = self._alerts.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            while len(batch) < ALERT_BATCH_SIZE:
+                try:
+                    item = self._alerts.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            # Consecutive alerts for the same channels go out together
+            for channels, group in itertools.groupby(batch, key=lambda item: item[1]):
+                try:
+                    self.send_alerts([alert for alert, _ in group], channels)
+                except Exception as e:
+                    logger.exception("Error sending queued alerts: %s", e)
+
+    def send_alerts(self, alerts: List[Dict[str, Any]], channels: List[str] = None):
+        """Send several alerts through specified channels
+
+        Each channel sends the whole batch over one connection: a single
+        SMTP session for all emails and the keep-alive HTTP session for
+        the Slack posts.
+        """
+        if not alerts:
+            return
+        # Unconfigured channels were reported once at startup, so they are
+        # only an error when the caller asked for them explicitly
+        explicit = bool(channels)
         if not channels:
             channels = ['slack', 'email']
 
+        futures = []
         for channel in channels:
+            sender = self._channel_senders.get(channel)
+            if sender is None:
+                if explicit:
+                    logger.error("Notification channel not configured: %s", channel)
+                continue
+            futures.append((channel, self._channel_executor.submit(sender, alerts)))
+
+        # A failing channel does not prevent delivery on the others
+        for channel, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logger.exception("Error sending alert via %s: %s", channel, e)
+
+    def _send_slack_alerts(self, alerts: List[Dict[str, Any]]):
+        """Send alerts to Slack over the keep-alive HTTP session"""
+        for alert in alerts:
             try:
-                if channel == 'slack':
-                    self._send_slack_alert(alert)
-                elif channel == 'email':
-                    self._send_email_alert(alert)
+                self._send_slack_alert(alert)
             except Exception as e:
-                print(f"Error sending alert via {channel}: {e}")
+                logger.exception("Error sending alert via slack: %s", e)
 
     def _send_slack_alert(self, alert: Dict[str, Any]):
         """Send alert to Slack"""
-        if not self.slack_webhook_url:
-            raise ValueError("Slack webhook URL not configured")
-
-        severity_colors = {
-            'critical': '#FF0000',
-            'high': '#FFA500',
-            'medium': '#FFFF00',
-            'low': '#00FF00'
-        }
-
+        get = alert.get
+        now = datetime.now()
         message = {
             'attachments': [{
-                'color': severity_colors.get(alert.get('severity', 'medium').lower(), '#808080'),
-                'title': f"Security Alert: {alert.get('title', 'Unknown Alert')}",
+                'color': SEVERITY_COLORS.get(get('severity', 'medium').lower(), '#808080'),
+                'title': f"Security Alert: {get('title', 'Unknown Alert')}",
                 'fields': [
                     {
                         'title': 'Severity',
-                        'value': alert.get('severity', 'Unknown'),
+                        'value': get('severity', 'Unknown'),
                         'short': True
                     },
                     {
                         'title': 'Source',
-                        'value': alert.get('source', 'Unknown'),
+                        'value': get('source', 'Unknown'),
                         'short': True
                     },
                     {
                         'title': 'Description',
-                        'value': alert.get('description', 'No description provided'),
+                        'value': get('description', 'No description provided'),
                         'short': False
                     },
                     {
                         'title': 'Impact',
-                        'value': alert.get('impact', 'No impact assessment'),
+                        'value': get('impact', 'No impact assessment'),
                         'short': False
                     },
                     {
                         'title': 'Recommendations',
-                        'value': '\n'.join(alert.get('recommendations', ['No recommendations'])),
+                        'value': '\n'.join(get('recommendations', ['No recommendations'])),
                         'short': False
                     }
                 ],
-                'footer': f"AluhaSOC | {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
-                'ts': int(datetime.now().timestamp())
+                'footer': f"AluhaSOC | {now.strftime('%Y-%m-%d %H:%M:%S')}",
+                'ts': int(now.timestamp())
             }]
         }
 
-        response = requests.post(
+        response = self._http.post(
             self.slack_webhook_url,
-            json=message
+            data=orjson.dumps(message),
+            headers={'Content-Type': 'application/json'},
+            timeout=SLACK_TIMEOUT
         )
         response.raise_for_status()
 
-    def _send_email_alert(self, alert: Dict[str, Any]):
-        """Send alert via email"""
-        if not all([self.smtp_config['username'], self.smtp_config['password']]):
-            raise ValueError("SMTP credentials not configured")
+    def _send_email_alerts(self, alerts: List[Dict[str, Any]]):
+        """Send alerts via email over a single SMTP session"""
+        # Messages built together share one timestamp
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._smtp_lock:
+            check = True
+            for alert in alerts:
+                try:
+                    msg = self._build_email(alert, timestamp)
+                    # Only probe the session before the first message
+                    self._send_email(msg, check=check)
+                    check = False
+                except Exception as e:
+                    logger.exception("Error sending email: %s", e)
 
-        msg = MIMEMultipart()
+    def _build_email(self, alert: Dict[str, Any], timestamp: str) -> EmailMessage:
+        """Build the email message for an alert"""
+        get = alert.get
+        title = get('title', 'Unknown Alert')
+
+        # A single-part message; alerts carry no attachments
+        msg = EmailMessage()
         msg['From'] = self.smtp_config['from_email']
-        msg['To'] = alert.get('recipients', self.config['default_recipients'])
-        msg['Subject'] = f"Security Alert: {alert.get('title', 'Unknown Alert')}"
+        msg['To'] = get('recipients', self.config['default_recipients'])
+        msg['Subject'] = f"Security Alert: {title}"
 
-        body = f"""
-        Security Alert Details:
-        
-        Title: {alert.get('title', 'Unknown Alert')}
-        Severity: {alert.get('severity', 'Unknown')}
-        Source: {alert.get('source', 'Unknown')}
-        Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        
-        Description:
-        {alert.get('description', 'No description provided')}
-        
-        Impact:
-        {alert.get('impact', 'No impact assessment')}
-        
-        Recommendations:
-        {chr(10).join(alert.get('recommendations', ['No recommendations']))}
-        
-        Additional Information:
-        {alert.get('additional_info', 'No additional information')}
+        body = EMAIL_BODY_TEMPLATE.format(
+            title=title,
+            severity=get('severity', 'Unknown'),
+            source=get('source', 'Unknown'),
+            timestamp=timestamp,
+            description=get('description', 'No description provided'),
+            impact=get('impact', 'No impact assessment'),
+            recommendations='\n'.join(get('recommendations', ['No recommendations'])),
+            additional_info=get('additional_info', 'No additional information')
+        )
+
+        msg.set_content(body)
+        return msg
+
+    def _send_email(self, msg: EmailMessage, check: bool = True):
+        """Send one message on the cached SMTP session
+
+        smtplib resets the envelope itself when a transaction fails, so
+        consecutive messages can share the session. Call with _smtp_lock
+        held.
         """
+        for attempt in range(SMTP_SEND_ATTEMPTS):
+            try:
+                self._get_smtp(check).send_message(msg)
+                break
+            except (smtplib.SMTPServerDisconnected, ConnectionResetError):
+                # The server dropped the session; reconnect and retry
+                self._close_smtp()
+                if attempt == SMTP_SEND_ATTEMPTS - 1:
+                    raise
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+        self._smtp_sent += 1
 
-        msg.attach(MIMEText(body, 'plain'))
+    def _get_smtp(self, check: bool = True) -> smtplib.SMTP:
+        """Return the cached SMTP session, connecting if needed
 
-        try:
-            with smtplib.SMTP(self.smtp_config['server'], self.smtp_config['port']) as server:
+        STARTTLS and authentication only happen when a new connection is
+        opened, not for every message. Call with _smtp_lock held.
+        """
+        if self._smtp is not None and self._smtp_sent >= SMTP_MAX_MESSAGES_PER_CONNECTION:
+            self._close_smtp()
+
+        if self._smtp is not None and check:
+            try:
+                self._smtp.noop()
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self._close_smtp()
+
+        if self._smtp is None:
+            server = smtplib.SMTP(
+                self.smtp_config['server'], self.smtp_config['port'], timeout=SMTP_TIMEOUT
+            )
+            try:
                 server.starttls()
                 server.login(self.smtp_config['username'], self.smtp_config['password'])
-                server.send_message(msg)
-        except Exception as e:
-            print(f"Error sending email: {e}")
-            raise
+            except Exception:
+                server.close()
+                raise
+            self._smtp = server
+            self._smtp_sent = 0
+        return self._smtp
+
+    def _close_smtp(self):
+        """Close the cached SMTP session. Call with _smtp_lock held."""
+        server, self._smtp = self._smtp, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def close(self):
+        """Send the alerts still queued and close connections held by
+        the notifier"""
+        with self._closed_lock:
+            stop, self._closed = not self._closed, True
+        if stop:
+            self._alerts.put(_STOP)
+            self._sender.join()
+        self._channel_executor.shutdown(wait=True)
+        self._http.close()
+        with self._smtp_lock:
+            self._close_smtp()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
     def format_incident_notification(self, incident: Dict[str, Any]) -> Dict[str, Any]:
         """Format incident details for notification"""
+        get = incident.get
         return {
-            'title': f"Security Incident: {incident.get('id', 'Unknown')}",
-            'severity': incident.get('severity', 'medium'),
-            'source': incident.get('source', 'Unknown'),
-            'description': incident.get('description', 'No description provided'),
-            'impact': incident.get('impact', 'No impact assessment'),
-            'recommendations': incident.get('remediation', ['No recommendations']),
+            'title': f"Security Incident: {get('id', 'Unknown')}",
+            'severity': get('severity', 'medium'),
+            'source': get('source', 'Unknown'),
+            'description': get('description', 'No description provided'),
+            'impact': get('impact', 'No impact assessment'),
+            'recommendations': get('remediation', ['No recommendations']),
             'additional_info': {
-                'timeline': incident.get('timeline', []),
-                'root_cause': incident.get('root_cause', 'Unknown'),
-                'affected_systems': incident.get('affected_systems', []),
-                'status': incident.get('status', 'Unknown')
+                'timeline': get('timeline', []),
+                'root_cause': get('root_cause', 'Unknown'),
+                'affected_systems': get('affected_systems', []),
+                'status': get('status', 'Unknown')
             }
         } 
\ No newline at end of file
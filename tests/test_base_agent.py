@@ -0,0 +1,132 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from agents import base_agent
+from agents.base_agent import BaseLogAgent, LogRecord, now_iso, prefetch
+
+def test_prefetch_yields_every_item_in_order():
+    assert list(prefetch(iter(range(100)), maxsize=3)) == list(range(100))
+
+def test_prefetch_reraises_source_errors_after_buffered_items():
+    def pages():
+        yield 1
+        yield 2
+        raise RuntimeError("page request failed")
+
+    items = []
+    with pytest.raises(RuntimeError, match="page request failed"):
+        for item in prefetch(pages(), maxsize=10):
+            items.append(item)
+    assert items == [1, 2]
+
+def test_prefetch_early_close_stops_the_producer():
+    produced = []
+    finished = threading.Event()
+
+    def pages():
+        try:
+            for i in range(1000):
+                produced.append(i)
+                yield i
+        finally:
+            finished.set()
+
+    stream = prefetch(pages(), maxsize=2)
+    assert next(stream) == 0
+    stream.close()
+
+    # The producer was blocked on the full buffer; closing the consumer
+    # must release it instead of leaving it to read every page
+    assert finished.wait(timeout=5)
+    assert len(produced) < 1000
+
+@pytest.mark.parametrize('microsecond', [0, 1, 999999])
+def test_now_iso_matches_isoformat(monkeypatch, microsecond):
+    second = 1_700_000_000
+    monkeypatch.setattr(base_agent, '_now_cache', (None, None))
+    monkeypatch.setattr(base_agent.time, 'time_ns',
+                        lambda: second * 1_000_000_000 + microsecond * 1000 + 999)
+    expected = datetime.fromtimestamp(second).replace(microsecond=microsecond).isoformat()
+    assert now_iso() == expected
+
+class StubAgent(BaseLogAgent):
+    def connect(self):
+        return True
+
+    def disconnect(self):
+        pass
+
+    def fetch_logs(self, start_time=None, end_time=None):
+        return []
+
+    def parse_log(self, log):
+        return LogRecord(message=log)
+
+@pytest.fixture
+def agent(tmp_path):
+    config = tmp_path / 'log_sources.yaml'
+    config.write_text('batch_size: 2\nmax_workers: 4\n')
+    return StubAgent(str(config))
+
+def test_fetch_concurrently_yields_logs_of_every_task(agent):
+    tasks = [(f"service {n}", lambda n=n: [f"{n}-{i}" for i in range(5)]) for n in range(3)]
+    logs = list(agent._fetch_concurrently(tasks))
+    assert sorted(logs) == sorted(f"{n}-{i}" for n in range(3) for i in range(5))
+
+def test_fetch_concurrently_keeps_going_when_a_task_fails(agent):
+    def failing():
+        yield 'before'
+        raise RuntimeError("service unavailable")
+
+    tasks = [('failing', failing), ('healthy', lambda: ['a', 'b', 'c'])]
+    assert sorted(agent._fetch_concurrently(tasks)) == ['a', 'b', 'before', 'c']
+
+def test_fetch_concurrently_early_close_releases_fetchers(agent):
+    finished = threading.Event()
+
+    def endless():
+        try:
+            while True:
+                yield 'log'
+        finally:
+            finished.set()
+
+    stream = agent._fetch_concurrently([('endless', endless)])
+    assert next(stream) == 'log'
+    stream.close()
+    assert finished.wait(timeout=5)
+
+def test_get_status_does_not_contact_the_source(agent, monkeypatch):
+    def connect():
+        raise AssertionError("get_status must not connect")
+    monkeypatch.setattr(agent, 'connect', connect)
+    assert agent.get_status()['connected'] is None
+
+def test_get_status_reports_the_last_probe(agent):
+    assert agent.probe() is True
+    status = agent.get_status()
+    assert status['connected'] is True
+    assert status['last_probe'] is not None
+
+def test_window_start_resumes_after_the_previous_window(agent):
+    default = datetime(2024, 1, 1, 11)
+    end = datetime(2024, 1, 1, 12)
+    assert agent._window_start('logging', None, default) == default
+
+    agent._last_end_time['logging'] = end
+    assert agent._window_start('logging', None, default) == end - timedelta(seconds=300)
+    # An explicit start is used as given
+    assert agent._window_start('logging', default, default) == default
+
+def test_seen_ids_skip_entries_of_the_overlap(agent):
+    seen = agent._seen_ids['logging']
+    first_end = datetime(2024, 1, 1, 12)
+    assert seen.add('entry', first_end)
+
+    seen.prune(first_end - agent.ingestion_lag)
+    assert not seen.add('entry', first_end + timedelta(minutes=1))
+    # Once a window starts after the entry's window, it is forgotten
+    seen.prune(first_end + timedelta(seconds=1))
+    assert seen.add('entry', first_end + timedelta(minutes=2))
@@ -0,0 +1,81 @@
+import pytest
+
+from analysis.event_store import EventStore, MAX_INLINE_RAW_BYTES, REDIS_KEY_PREFIX
+
+SMALL_EVENT = {'id': 'small', 'message': 'login failed'}
+LARGE_EVENT = {'id': 'large', 'message': 'x' * (MAX_INLINE_RAW_BYTES + 1)}
+
+class FakeRedis:
+    """Just the Redis calls EventStore makes, backed by a dict"""
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.expiry[key] = ex
+
+    def get(self, key):
+        return self.data.get(key)
+
+class DownRedis(FakeRedis):
+    def set(self, key, value, ex=None):
+        raise ConnectionError("Redis is down")
+
+def test_put_and_get_round_trip():
+    store = EventStore()
+    raw_ref, _ = store.put(SMALL_EVENT)
+    assert store.get(raw_ref) == SMALL_EVENT
+
+def test_identical_events_share_a_reference():
+    store = EventStore()
+    first, _ = store.put({'a': 1, 'b': 2})
+    second, _ = store.put({'b': 2, 'a': 1})
+    assert first == second
+
+def test_publish_time_does_not_change_the_reference():
+    store = EventStore()
+    first, _ = store.put({'id': 'e', 'published_at': '2024-01-01T00:00:00.000001'})
+    second, _ = store.put({'id': 'e', 'published_at': '2024-01-01T00:01:00.000001'})
+    assert first == second
+    assert store.get(first) == {'id': 'e'}
+
+def test_get_unknown_reference_returns_none():
+    assert EventStore().get('0000000000000000') is None
+
+def test_least_recently_stored_event_is_evicted():
+    store = EventStore(max_events=2)
+    oldest, _ = store.put({'n': 1})
+    middle, _ = store.put({'n': 2})
+    # Storing an event again makes it the most recent one
+    store.put({'n': 1})
+    newest, _ = store.put({'n': 3})
+
+    assert store.get(middle) is None
+    assert store.get(oldest) == {'n': 1}
+    assert store.get(newest) == {'n': 3}
+
+@pytest.mark.parametrize('event', [SMALL_EVENT, LARGE_EVENT])
+def test_local_store_always_inlines_raw_data(event):
+    # Other processes cannot resolve references into a local store
+    info = EventStore().additional_info(event, iocs=['1.2.3.4'])
+    assert info['raw_data'] == event
+    assert info['iocs'] == ['1.2.3.4']
+    assert 'raw_ref' in info
+
+def test_shared_store_inlines_only_small_events():
+    redis = FakeRedis()
+    store = EventStore(redis_client=redis, ttl=60)
+
+    small = store.additional_info(SMALL_EVENT)
+    large = store.additional_info(LARGE_EVENT)
+
+    assert small['raw_data'] == SMALL_EVENT
+    assert 'raw_data' not in large
+    assert store.get(large['raw_ref']) == LARGE_EVENT
+    assert redis.expiry[REDIS_KEY_PREFIX + large['raw_ref']] == 60
+
+def test_failed_redis_write_inlines_raw_data():
+    info = EventStore(redis_client=DownRedis()).additional_info(LARGE_EVENT)
+    assert info['raw_data'] == LARGE_EVENT
+    assert 'raw_ref' not in info
@@ -0,0 +1,111 @@
+import importlib
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from analysis.llm.client import LLMClient
+
+AUTHKEY = b'test-authkey'
+
+class FakeEngine:
+    """Stands in for LLMAnalysisEngine so no model is loaded"""
+    def __init__(self, config_path):
+        self.config = {'model': {'name': 'fake'}}
+        self.batches = []
+        self.busy = threading.Event()
+        self.release = threading.Event()
+
+    def analyze_security_events_batch(self, events):
+        self.batches.append(list(events))
+        self.busy.set()
+        self.release.wait(timeout=5)
+        if any(event.get('fail') for event in events):
+            raise ValueError("model failed")
+        return [{'event': event['id']} for event in events]
+
+    def summarize_incident(self, incident):
+        return {'summary': incident['id']}
+
+@pytest.fixture
+def server(monkeypatch):
+    fake_engine = types.ModuleType('analysis.llm.engine')
+    fake_engine.LLMAnalysisEngine = FakeEngine
+    monkeypatch.setitem(sys.modules, 'analysis.llm.engine', fake_engine)
+    monkeypatch.delitem(sys.modules, 'analysis.llm.server', raising=False)
+    server_module = importlib.import_module('analysis.llm.server')
+
+    server = server_module.InferenceServer('config/llm.yaml', ('127.0.0.1', 0), AUTHKEY)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    # The daemon serving threads stay blocked in accept until the test
+    # session exits
+    server.engine.release.set()
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_client_reads_engine_config(server):
+    client = LLMClient(server.listener.address, AUTHKEY)
+    assert client.config == {'model': {'name': 'fake'}}
+    assert client.summarize_incident({'id': 'INC-1'}) == {'summary': 'INC-1'}
+    client.close()
+
+def test_requests_of_several_clients_are_batched_together(server):
+    clients = [LLMClient(server.listener.address, AUTHKEY) for _ in range(3)]
+    results = {}
+
+    def analyze(n, client):
+        events = [{'id': f"{n}-{i}"} for i in range(n + 1)]
+        results[n] = client.analyze_security_events_batch(events)
+
+    # Hold the model in the first request while the others queue up
+    threads = [threading.Thread(target=analyze, args=(0, clients[0]))]
+    threads[0].start()
+    assert server.engine.busy.wait(timeout=5)
+    for n in (1, 2):
+        threads.append(threading.Thread(target=analyze, args=(n, clients[n])))
+        threads[-1].start()
+    wait_until(lambda: server._requests.qsize() == 2)
+
+    server.engine.release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert len(server.engine.batches) == 2
+    assert sorted(e['id'] for e in server.engine.batches[1]) == ['1-0', '1-1', '2-0', '2-1', '2-2']
+    for n in range(3):
+        assert results[n] == [{'event': f"{n}-{i}"} for i in range(n + 1)]
+    for client in clients:
+        client.close()
+
+def test_engine_errors_are_raised_in_the_client(server):
+    server.engine.release.set()
+    client = LLMClient(server.listener.address, AUTHKEY)
+    with pytest.raises(RuntimeError, match="model failed"):
+        client.analyze_security_events_batch([{'id': 'e', 'fail': True}])
+    # The connection stays usable after an error reply
+    assert client.analyze_security_event({'id': 'ok'}) == {'event': 'ok'}
+    client.close()
+
+def test_client_reconnects_when_the_connection_drops(server):
+    server.engine.release.set()
+    client = LLMClient(server.listener.address, AUTHKEY)
+    client._conn.close()
+    assert client.analyze_security_event({'id': 'after'}) == {'event': 'after'}
+    client.close()
+
+@pytest.mark.parametrize('args', [(), (None,), (42,)])
+def test_malformed_requests_do_not_stop_the_server(server, args):
+    server.engine.release.set()
+    client = LLMClient(server.listener.address, AUTHKEY)
+    with pytest.raises(RuntimeError, match="Malformed analysis request"):
+        client._call('analyze_security_events_batch', *args)
+    # Other requests are still served after the malformed one
+    assert client.analyze_security_event({'id': 'next'}) == {'event': 'next'}
+    client.close()
@@ -0,0 +1,108 @@
+import logging
+import threading
+
+import pytest
+
+from notifications import notifier
+
+class FakeSMTP:
+    """Records the messages sent instead of talking to a mail server"""
+    sent = []
+    release = threading.Event()
+    sending = threading.Event()
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def noop(self):
+        pass
+
+    def send_message(self, msg):
+        FakeSMTP.sending.set()
+        FakeSMTP.release.wait(timeout=5)
+        FakeSMTP.sent.append(msg['Subject'])
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def config_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(notifier.smtplib, 'SMTP', FakeSMTP)
+    monkeypatch.setattr(FakeSMTP, 'sent', [])
+    monkeypatch.setattr(FakeSMTP, 'release', threading.Event())
+    monkeypatch.setattr(FakeSMTP, 'sending', threading.Event())
+    monkeypatch.delenv('SLACK_WEBHOOK_URL', raising=False)
+    monkeypatch.setenv('SMTP_USERNAME', 'soc')
+    monkeypatch.setenv('SMTP_PASSWORD', 'secret')
+    monkeypatch.setenv('FROM_EMAIL', 'soc@example.com')
+
+    config = tmp_path / 'notifications.yaml'
+    config.write_text('default_recipients: analyst@example.com\n')
+    return str(config)
+
+def test_close_sends_alerts_still_queued(config_path):
+    alerts = notifier.Notifier(config_path)
+    for n in range(5):
+        alerts.send_alert({'title': f"alert {n}"}, channels=['email'])
+    FakeSMTP.release.set()
+    alerts.close()
+
+    assert FakeSMTP.sent == [f"Security Alert: alert {n}" for n in range(5)]
+
+def test_send_alert_drops_alerts_when_queue_is_full(config_path, monkeypatch):
+    monkeypatch.setattr(notifier, 'ALERT_QUEUE_SIZE', 2)
+    alerts = notifier.Notifier(config_path)
+
+    # Hold the sender in the first email so later alerts stay queued
+    alerts.send_alert({'title': 'sending'}, channels=['email'])
+    assert FakeSMTP.sending.wait(timeout=5)
+    for n in range(3):
+        alerts.send_alert({'title': f"queued {n}"}, channels=['email'])
+    assert alerts.dropped_alerts == 1
+
+    FakeSMTP.release.set()
+    alerts.close()
+    assert FakeSMTP.sent == ["Security Alert: sending",
+                             "Security Alert: queued 0",
+                             "Security Alert: queued 1"]
+
+def test_unconfigured_default_channels_are_not_errors(config_path, caplog):
+    FakeSMTP.release.set()
+    with notifier.Notifier(config_path) as alerts:
+        alerts.send_alerts([{'title': 'default channels'}])
+        alerts.send_alerts([{'title': 'explicit slack'}], channels=['slack'])
+
+    # Slack is missing from the defaults too, but only the explicit
+    # request for it is reported
+    assert FakeSMTP.sent == ["Security Alert: default channels"]
+    errors = [r.getMessage() for r in caplog.records if r.levelno >= logging.ERROR]
+    assert errors == ["Notification channel not configured: slack"]
+
+def test_alert_that_fails_to_build_does_not_drop_the_batch(config_path):
+    FakeSMTP.release.set()
+    with notifier.Notifier(config_path) as alerts:
+        # A non-string recommendation cannot be joined into the body
+        alerts.send_alerts([{'title': 'first'},
+                            {'title': 'broken', 'recommendations': [None]},
+                            {'title': 'last'}], channels=['email'])
+
+    assert FakeSMTP.sent == ["Security Alert: first", "Security Alert: last"]
+
+def test_send_alert_after_close_is_dropped(config_path):
+    FakeSMTP.release.set()
+    alerts = notifier.Notifier(config_path)
+    alerts.close()
+    alerts.send_alert({'title': 'too late'}, channels=['email'])
+    alerts.close()
+
+    assert alerts.dropped_alerts == 1
+    assert FakeSMTP.sent == []